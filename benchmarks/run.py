@@ -0,0 +1,356 @@
+"""
+End-to-end benchmarks: WeatherDaemon is driven by synthetic producers and uploads to a local stand-in of the
+ingestion server (see benchmarks.server), running in a separate process so that its CPU time is not accounted.
+
+Scenarios:
+  sensor   drain a burst of sensor readings
+  webcam   upload a series of webcam snapshots
+  outage   produce readings at a steady rate while the server goes down for a while, then measure recovery
+
+Example: python -m benchmarks.run sensor --readings 5000 --latency-ms 50
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+from metarstation_daemon.backend.interface import SensorBackend, SensorBackendQueue, WebcamBackend
+from metarstation_daemon.data import SensorData, WebcamData, TimelapseData
+from metarstation_daemon.frontend.interface import DataFrontend
+from metarstation_daemon.main import WeatherDaemon
+from .server import ServerOptions, serve
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SyntheticSensorBackend(SensorBackend):
+    """Pushes random-walk readings at the given rate (0 = as fast as the daemon can take them)."""
+
+    def __init__(self, count: int, rate: float, queue: SensorBackendQueue):
+        super().__init__({}, queue)
+        self.count = count
+        self.rate = rate
+        self.produced = 0
+        self.done = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._produce(), name='synthetic-sensor')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _produce(self):
+        base = datetime.datetime.now(datetime.UTC)
+        data = SensorData(temperature=15.0, humidity=60.0, dew_point=7.0, pressure=1013.0, illumination=20000.0,
+                          wind_speed=5.0, gust_speed=8.0, wind_direction=270, uv_index=3, raining=False,
+                          precipitation=0.0, battery=90)
+        for index in range(self.count):
+            data = SensorData(
+                # unique timestamps allow the server to count lost readings
+                timestamp=base + datetime.timedelta(milliseconds=index),
+                battery=data.battery,
+                temperature=data.temperature + random.uniform(-0.1, 0.1),
+                humidity=data.humidity,
+                dew_point=data.dew_point,
+                pressure=data.pressure + random.uniform(-0.05, 0.05),
+                illumination=data.illumination,
+                wind_speed=max(data.wind_speed + random.uniform(-0.5, 0.5), 0),
+                gust_speed=max(data.gust_speed + random.uniform(-0.5, 0.5), 0),
+                wind_direction=(data.wind_direction + random.randint(-5, 5)) % 360,
+                uv_index=data.uv_index,
+                raining=data.raining,
+                precipitation=data.precipitation,
+            )
+            while True:
+                try:
+                    self.queue.push(data)
+                    break
+                except asyncio.QueueFull:
+                    await asyncio.sleep(0.001)
+            self.produced += 1
+            await asyncio.sleep(1 / self.rate if self.rate > 0 else 0)
+        self.done.set()
+
+
+class SyntheticWebcamBackend(WebcamBackend):
+    """Produces fake JPEG images of the given size at the given interval."""
+
+    def __init__(self, count: int, image_size: int, interval_secs: float, callback):
+        super().__init__({}, callback)
+        self.count = count
+        self.image_size = image_size
+        self.interval_secs = interval_secs
+        self.produced = 0
+        self.done = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._produce(), name='synthetic-webcam')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _produce(self):
+        for _ in range(self.count):
+            self.callback.update(WebcamData(
+                timestamp=datetime.datetime.now(datetime.UTC),
+                image_data=b'\xff\xd8' + os.urandom(self.image_size - 4) + b'\xff\xd9',
+                image_type='image/jpeg',
+            ))
+            self.produced += 1
+            await asyncio.sleep(self.interval_secs)
+        self.done.set()
+
+
+@dataclass
+class UploadTimings:
+    latencies: list[float] = field(default_factory=list)
+    successes: list[float] = field(default_factory=list)
+    failures: int = 0
+
+
+class TimedFrontend(DataFrontend):
+    """Wraps a frontend measuring upload latency."""
+
+    def __init__(self, frontend: DataFrontend):
+        super().__init__({})
+        self._frontend = frontend
+        frontend.upload_listener = self._report_upload
+        self.data = UploadTimings()
+        self.webcam = UploadTimings()
+        self.delivered: set[datetime.datetime] = set()
+        self.in_flight = 0
+
+    async def setup(self):
+        await self._frontend.setup()
+
+    async def send_data(self, data: list[SensorData]):
+        await self._timed(self.data, self._frontend.send_data(data))
+        self.delivered.update(x.timestamp for x in data)
+
+    async def send_webcam(self, data: WebcamData):
+        await self._timed(self.webcam, self._frontend.send_webcam(data))
+
+    async def send_timelapse(self, data: TimelapseData):
+        await self._frontend.send_timelapse(data)
+
+    async def _timed(self, timings: UploadTimings, coro):
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            await coro
+            timings.successes.append(time.perf_counter())
+        except Exception:
+            timings.failures += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            timings.latencies.append(time.perf_counter() - start)
+
+
+class BenchmarkDaemon(WeatherDaemon):
+
+    def __init__(self, args, options: argparse.Namespace):
+        self.options = options
+        self.sensor: SyntheticSensorBackend | None = None
+        self.timed_frontend: TimedFrontend | None = None
+        super().__init__(args)
+        self.webcam: SyntheticWebcamBackend | None = self._webcam
+
+    def _create_sensor_backend(self, config: dict, queue: SensorBackendQueue) -> SensorBackend:
+        self.sensor = SyntheticSensorBackend(self.options.readings, self.options.rate, queue)
+        return self.sensor
+
+    def _create_webcam_backend(self, config: dict, callback) -> WebcamBackend:
+        return SyntheticWebcamBackend(self.options.images, self.options.image_kb * 1024,
+                                      self.options.interval_secs, callback)
+
+    def _create_frontend(self, config: dict) -> DataFrontend:
+        self.timed_frontend = TimedFrontend(super()._create_frontend(config))
+        return self.timed_frontend
+
+    def idle(self) -> bool:
+        producers = [self.sensor] + ([self.webcam] if self.webcam else [])
+        return (all(p.done.is_set() for p in producers) and self._data_queue.empty() and not self._failed_data
+                and not self._webcam_callback.has_data() and self.timed_frontend.in_flight == 0)
+
+    def drained(self) -> bool:
+        return len(self.timed_frontend.delivered) == self.sensor.produced and self.idle()
+
+
+def _percentile(values: list[float], percentile: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else float('nan')
+    return statistics.quantiles(values, n=100, method='inclusive')[percentile - 1]
+
+
+def _write_config(options: argparse.Namespace) -> str:
+    base_url = f"http://127.0.0.1:{options.port}"
+    config = (f'[backend]\n'
+              f'\n'
+              f'[frontend]\n'
+              f'data_url = "{base_url}/push"\n'
+              f'image_url = "{base_url}/image"\n'
+              f'api_token = "benchmark"\n'
+              f'timeout_secs = {options.timeout_secs}\n')
+    if options.images:
+        config += '\n[webcam]\n'
+    fd, path = tempfile.mkstemp(suffix='.toml', prefix='benchmark-')
+    with os.fdopen(fd, 'w') as fp:
+        fp.write(config)
+    return path
+
+
+async def _wait_server(options: argparse.Namespace):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.post(f"http://127.0.0.1:{options.port}/reset")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.05)
+    raise RuntimeError('Ingestion server did not start')
+
+
+async def _server_stats(options: argparse.Namespace) -> dict:
+    async with httpx.AsyncClient() as client:
+        return (await client.get(f"http://127.0.0.1:{options.port}/stats")).json()
+
+
+async def _run_scenario(options: argparse.Namespace) -> dict:
+    config_path = _write_config(options)
+    try:
+        daemon = BenchmarkDaemon(['benchmark', '-c', config_path], options)
+    finally:
+        os.unlink(config_path)
+
+    # align the server clock (for outage windows) with the benchmark start
+    await _wait_server(options)
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    daemon_task = asyncio.get_running_loop().create_task(daemon.run(), name='benchmark-daemon')
+    timed_out = False
+    idle_since = None
+    while not daemon.drained():
+        if time.perf_counter() - start > options.max_secs:
+            timed_out = True
+            break
+        # readings might be lost (e.g. during outages): stop when nothing happens for a while
+        if not daemon.idle():
+            idle_since = None
+        elif idle_since is None:
+            idle_since = time.perf_counter()
+        elif time.perf_counter() - idle_since > 1:
+            break
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    daemon.shutdown()
+    await daemon_task
+
+    stats = await _server_stats(options)
+    timings = daemon.timed_frontend
+    produced_readings = daemon.sensor.produced
+    produced_images = daemon.webcam.produced if daemon.webcam else 0
+    result = {
+        'scenario': options.scenario,
+        'elapsed_secs': elapsed,
+        'timed_out': timed_out,
+        'readings_produced': produced_readings,
+        'readings_delivered': stats['readings_unique'],
+        'readings_lost': produced_readings - stats['readings_unique'],
+        'readings_per_sec': stats['readings_unique'] / elapsed,
+        'data_upload_p50_ms': _percentile(timings.data.latencies, 50) * 1000,
+        'data_upload_p99_ms': _percentile(timings.data.latencies, 99) * 1000,
+        'data_upload_failures': timings.data.failures,
+        'images_produced': produced_images,
+        'images_delivered': stats['images'],
+        'image_upload_p50_ms': _percentile(timings.webcam.latencies, 50) * 1000,
+        'image_upload_p99_ms': _percentile(timings.webcam.latencies, 99) * 1000,
+        'server_requests': stats['requests'],
+        'cpu_secs': cpu,
+        'cpu_ms_per_reading': cpu / produced_readings * 1000 if produced_readings else float('nan'),
+        'cpu_ms_per_image': cpu / produced_images * 1000 if produced_images else float('nan'),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if options.outage_secs:
+        outage_end = start + options.outage_start_secs + options.outage_secs
+        recovered = [t for t in timings.data.successes if t >= outage_end]
+        result['recovery_secs'] = recovered[0] - outage_end if recovered else float('nan')
+    return result
+
+
+SCENARIOS = {
+    'sensor': dict(readings=2000, rate=0, images=0),
+    'webcam': dict(readings=1, rate=0, images=30, interval_secs=0.5),
+    'outage': dict(readings=600, rate=20, images=0, outage_start_secs=5, outage_secs=10),
+}
+
+_SCENARIO_OPTION_DEFAULTS = dict(interval_secs=0, outage_start_secs=0, outage_secs=0)
+"""Defaults of the options that scenarios can override, when not given on the command line."""
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description='WeatherDaemon end-to-end benchmarks')
+    args_parser.add_argument('scenario', choices=SCENARIOS.keys())
+    args_parser.add_argument('--readings', type=int, help='number of sensor readings to produce')
+    args_parser.add_argument('--rate', type=float, help='sensor readings per second (0 = unlimited)')
+    args_parser.add_argument('--images', type=int, help='number of webcam images to produce')
+    args_parser.add_argument('--image-kb', type=int, default=150, help='webcam image size')
+    args_parser.add_argument('--interval-secs', type=float, help='webcam image interval')
+    args_parser.add_argument('--latency-ms', type=float, default=0, help='server latency')
+    args_parser.add_argument('--error-rate', type=float, default=0, help='server error probability')
+    args_parser.add_argument('--bandwidth-kbps', type=float, default=0, help='server bandwidth (0 = unlimited)')
+    args_parser.add_argument('--outage-start-secs', type=float, help='server outage start')
+    args_parser.add_argument('--outage-secs', type=float, help='server outage duration')
+    args_parser.add_argument('--timeout-secs', type=int, default=10, help='frontend upload timeout')
+    args_parser.add_argument('--max-secs', type=float, default=300, help='benchmark time limit')
+    args_parser.add_argument('--port', type=int, default=18787)
+    args_parser.add_argument('--json', action='store_true', help='output results as JSON')
+    args_parser.add_argument('-v', '--verbose', action='store_true', help='enable daemon logging')
+    options = args_parser.parse_args()
+
+    # scenario defaults for options not given on the command line
+    for name, value in (_SCENARIO_OPTION_DEFAULTS | SCENARIOS[options.scenario]).items():
+        if getattr(options, name) is None:
+            setattr(options, name, value)
+
+    logging.basicConfig(level=logging.DEBUG if options.verbose else logging.CRITICAL)
+
+    server = multiprocessing.Process(target=serve, daemon=True, args=(ServerOptions(
+        port=options.port,
+        latency_ms=options.latency_ms,
+        error_rate=options.error_rate,
+        bandwidth_kbps=options.bandwidth_kbps,
+        outage_start_secs=options.outage_start_secs,
+        outage_secs=options.outage_secs,
+    ),))
+    server.start()
+    try:
+        result = asyncio.run(_run_scenario(options))
+    finally:
+        server.terminate()
+
+    if options.json:
+        print(json.dumps(result))
+    else:
+        for name, value in result.items():
+            print(f"{name:>24}: {value:.3f}" if isinstance(value, float) else f"{name:>24}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Local stand-in for the data_url/image_url ingestion endpoints, with configurable latency, errors and bandwidth.
+
+POST /push   accepts a JSON array of readings
+POST /image  accepts an image
+GET  /stats  returns counters as JSON
+POST /reset  resets counters
+
+Run standalone with: python -m benchmarks.server --port 8787 --latency-ms 100
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass(kw_only=True)
+class ServerOptions:
+
+    host: str = '127.0.0.1'
+    port: int = 8787
+
+    latency_ms: float = 0
+    """Delay before each response."""
+
+    error_rate: float = 0
+    """Probability of answering with a server error."""
+
+    bandwidth_kbps: float = 0
+    """Maximum request body reception speed (kilobits per second), 0 for unlimited."""
+
+    outage_start_secs: float = 0
+    """Start of an outage window, relative to the server start."""
+
+    outage_secs: float = 0
+    """Length of the outage window (all requests fail with 503), 0 for no outage."""
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    errors: int = 0
+    readings: int = 0
+    readings_unique: set[str] = field(default_factory=set)
+    images: int = 0
+    image_bytes: int = 0
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'readings': self.readings,
+            'readings_unique': len(self.readings_unique),
+            'images': self.images,
+            'image_bytes': self.image_bytes,
+        }
+
+
+class IngestionServer:
+
+    def __init__(self, options: ServerOptions):
+        self.options = options
+        self.stats = ServerStats()
+        self._start = time.monotonic()
+
+    async def serve(self):
+        server = await asyncio.start_server(self._handle_connection, self.options.host, self.options.port)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, value = line.decode().split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await self._read_body(reader, int(headers.get('content-length', 0)))
+                status, response = await self._handle_request(method, target.split('?', 1)[0], body)
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(response)}\r\n\r\n".encode() + response)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_body(self, reader: asyncio.StreamReader, length: int) -> bytes:
+        if not self.options.bandwidth_kbps:
+            return await reader.readexactly(length)
+
+        # throttle reception in 100ms slices
+        chunk_size = max(int(self.options.bandwidth_kbps * 1000 / 8 / 10), 1)
+        chunks = []
+        remaining = length
+        while remaining > 0:
+            started = time.monotonic()
+            chunk = await reader.readexactly(min(chunk_size, remaining))
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            await asyncio.sleep(max(0.1 - (time.monotonic() - started), 0))
+        return b''.join(chunks)
+
+    def _in_outage(self) -> bool:
+        elapsed = time.monotonic() - self._start
+        return self.options.outage_start_secs <= elapsed < self.options.outage_start_secs + self.options.outage_secs
+
+    async def _handle_request(self, method: str, path: str, body: bytes) -> tuple[int, bytes]:
+        if method == 'GET' and path == '/stats':
+            return 200, json.dumps(self.stats.to_dict()).encode()
+        if method == 'POST' and path == '/reset':
+            self.stats = ServerStats()
+            self._start = time.monotonic()
+            return 200, b'{}'
+
+        self.stats.requests += 1
+        if self.options.latency_ms:
+            await asyncio.sleep(self.options.latency_ms / 1000)
+        if self._in_outage() or random.random() < self.options.error_rate:
+            self.stats.errors += 1
+            return 503, b'{}'
+
+        if method == 'POST' and path == '/push':
+            readings = json.loads(body)
+            self.stats.readings += len(readings)
+            self.stats.readings_unique.update(r['timestamp'] for r in readings)
+            return 201, b'{}'
+        if method == 'POST' and path == '/image':
+            self.stats.images += 1
+            self.stats.image_bytes += len(body)
+            return 201, b'{}'
+        return 404, b'{}'
+
+
+def serve(options: ServerOptions):
+    asyncio.run(IngestionServer(options).serve())
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description='Ingestion server stand-in')
+    args_parser.add_argument('--host', default='127.0.0.1')
+    args_parser.add_argument('--port', type=int, default=8787)
+    args_parser.add_argument('--latency-ms', type=float, default=0)
+    args_parser.add_argument('--error-rate', type=float, default=0)
+    args_parser.add_argument('--bandwidth-kbps', type=float, default=0)
+    args_parser.add_argument('--outage-start-secs', type=float, default=0)
+    args_parser.add_argument('--outage-secs', type=float, default=0)
+    args = args_parser.parse_args()
+    try:
+        serve(ServerOptions(**vars(args)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
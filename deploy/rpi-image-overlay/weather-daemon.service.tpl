@@ -6,6 +6,7 @@ After=multi-user.target
 User=$METARSTATION_USER
 Restart=always
 ExecStart=/opt/metarstation-daemon/weather-daemon.py -c /etc/metarstation/config.toml
+ExecReload=/bin/kill -HUP $MAINPID
 StandardError=journal
 
 [Install]
@@ -0,0 +1,84 @@
+import logging
+
+from . import ffmpeg
+from .ffmpeg import ImageEncoding
+
+_LOGGER = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {
+    'jpeg': ffmpeg.IMAGE_TYPE_JPEG,
+    'webp': ffmpeg.IMAGE_TYPE_WEBP,
+    'avif': ffmpeg.IMAGE_TYPE_AVIF,
+}
+
+_LEVELS: list[tuple[int | None, int]] = [
+    (None, 72),
+    (None, 55),
+    (720, 55),
+    (540, 45),
+    (360, 35),
+]
+"""Encoding levels (maximum height, quality), from the best to the smallest image."""
+
+_THROUGHPUT_SMOOTHING = 0.3
+"""Weight of the latest measurement in the throughput moving average."""
+
+_STEP_UP_MARGIN = 0.4
+"""Go back to a better level only if the expected transfer time is below this fraction of the target."""
+
+
+class EncodingPolicy:
+    """
+    Chooses size and quality of webcam snapshots from the upload throughput measured by the frontend (time spent
+    actually transferring images, not waiting in queues), to keep the transfer time of each image around a target.
+    Formats other than JPEG are used only if the server advertised support for them.
+    """
+
+    def __init__(self, config: dict):
+        self.target_upload_secs: float = config['target_upload_secs']
+        self.formats: list[str] = [IMAGE_FORMATS[name] for name in config.get('image_formats', ['jpeg'])]
+        self.level = 0
+        self.throughput: float | None = None
+        """Upload throughput in bytes per second (moving average)."""
+        self._accepted_types: set[str] | None = None
+
+    def encoding(self) -> ImageEncoding:
+        max_height, quality = _LEVELS[self.level]
+        return ImageEncoding(image_type=self._image_type(), max_height=max_height, quality=quality)
+
+    def record_upload(self, size: int, elapsed_secs: float, accepted_types: set[str] | None):
+        """Called after each successful transfer of a snapshot."""
+        self._accepted_types = accepted_types
+        if elapsed_secs <= 0:
+            return
+
+        throughput = size / elapsed_secs
+        if self.throughput is None:
+            self.throughput = throughput
+        else:
+            self.throughput += _THROUGHPUT_SMOOTHING * (throughput - self.throughput)
+
+        expected_secs = size / self.throughput
+        level = self.level
+        if expected_secs > self.target_upload_secs:
+            level = min(level + 1, len(_LEVELS) - 1)
+        elif expected_secs < self.target_upload_secs * _STEP_UP_MARGIN:
+            level = max(level - 1, 0)
+
+        if level != self.level:
+            _LOGGER.info(f"Image encoding level now {level} {_LEVELS[level]} "
+                         f"(throughput {self.throughput / 1024:.1f} KiB/s)")
+            self.level = level
+
+    def status(self) -> dict:
+        return {
+            'level': self.level,
+            'image_type': self._image_type(),
+            'throughput_kbps': round(self.throughput * 8 / 1000, 1) if self.throughput is not None else None,
+        }
+
+    def _image_type(self) -> str:
+        for image_type in self.formats:
+            if image_type == ffmpeg.IMAGE_TYPE_JPEG or (self._accepted_types and image_type in self._accepted_types):
+                return image_type
+        return ffmpeg.IMAGE_TYPE_JPEG
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+_LOGGER = logging.getLogger(__name__)
+
+IMAGE_TYPE_JPEG = 'image/jpeg'
+IMAGE_TYPE_WEBP = 'image/webp'
+IMAGE_TYPE_AVIF = 'image/avif'
+
+
+@dataclass(kw_only=True, frozen=True)
+class ImageEncoding:
+    image_type: str = IMAGE_TYPE_JPEG
+    max_height: int | None = None
+    """Downscale (keeping the aspect ratio) if the source is taller than this."""
+    quality: int = 72
+    """0-100, mapped to the quality scale of the encoder."""
+
+    def ffmpeg_args(self) -> list[str]:
+        args = []
+        if self.max_height:
+            args += ['-vf', f'scale=-2:min(ih\\,{self.max_height})']
+
+        if self.image_type == IMAGE_TYPE_JPEG:
+            # q:v goes from 2 (best) to 31 (worst)
+            qscale = round(31 - self.quality * 29 / 100)
+            args += ['-c:v', 'mjpeg', '-pix_fmt', 'yuvj420p', '-q:v', str(qscale), '-f', 'image2pipe']
+        elif self.image_type == IMAGE_TYPE_WEBP:
+            args += ['-c:v', 'libwebp', '-quality', str(self.quality), '-f', 'webp']
+        elif self.image_type == IMAGE_TYPE_AVIF:
+            # crf goes from 0 (best) to 63 (worst), cpu-used 8 is the fastest preset
+            crf = round(63 - self.quality * 63 / 100)
+            args += ['-c:v', 'libaom-av1', '-still-picture', '1', '-crf', str(crf), '-cpu-used', '8',
+                     '-pix_fmt', 'yuv420p', '-f', 'avif']
+        else:
+            raise ValueError(f'Unsupported image type: {self.image_type}')
+        return args
+
+
+DEFAULT_ENCODING = ImageEncoding()
+
+
+async def print_ffmpeg_logs(stderr):
+    _LOGGER.debug('ffmpeg snapshot output:')
+    while True:
+        line = await stderr.readline()
+        if not line:
+            break
+        _LOGGER.debug(f"  {line.decode().strip()}")
+
+
+async def take_snapshot(input_file: Path, encoding: ImageEncoding = DEFAULT_ENCODING) -> bytes | None:
+    """
+    ffmpeg -i stream_output.m3u8 -vframes 1 <encoding args> snapshot, through a pipe (or a temporary file for AVIF).
+    Format, maximum height and quality come from the encoding (see ImageEncoding.ffmpeg_args).
+    :param input_file: any input ffmpeg can read (HLS playlist, MPEG-TS segment, ...)
+    :param encoding: image format, size and quality
+    :return: image data or None if ffmpeg failed
+    """
+    if encoding.image_type == IMAGE_TYPE_AVIF:
+        # the AVIF muxer can't write to a pipe
+        with tempfile.TemporaryDirectory() as tempdir:
+            output_file = Path(tempdir) / 'snapshot.avif'
+            if await _run_snapshot(input_file, encoding, str(output_file)) is None:
+                return None
+            return output_file.read_bytes()
+    else:
+        return await _run_snapshot(input_file, encoding, 'pipe:1')
+
+
+async def _run_snapshot(input_file: Path, encoding: ImageEncoding, output: str) -> bytes | None:
+    cmd = [
+        'ffmpeg',
+        '-i',
+        str(input_file),
+        '-an',
+        '-vframes',
+        '1',
+        *encoding.ffmpeg_args(),
+        output,
+    ]
+    _LOGGER.debug(f"cmdline: {cmd}")
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    snapshot_data = await process.stdout.read()
+    await process.wait()
+    if process.returncode == 0:
+        return snapshot_data
+    else:
+        await print_ffmpeg_logs(process.stderr)
+        return None
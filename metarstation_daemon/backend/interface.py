@@ -1,14 +1,18 @@
 import asyncio
 
+from .encoding import EncodingPolicy
 from ..data import SensorData, WebcamData
 
 
 class SensorBackendQueue:
-    def __init__(self, queue):
+    def __init__(self, queue, wakeup: asyncio.Event | None = None):
         self._queue: asyncio.Queue[SensorData] = queue
+        self._wakeup = wakeup
 
     def push(self, data: SensorData):
         self._queue.put_nowait(data)
+        if self._wakeup:
+            self._wakeup.set()
 
 
 class SensorBackend:
@@ -29,13 +33,26 @@ class SensorBackend:
 
 
 class WebcamBackendCallback:
-    def __init__(self):
+    def __init__(self, wakeup: asyncio.Event | None = None):
         self._data: WebcamData|None = None
         self._event = asyncio.Event()
+        self._wakeup = wakeup
 
     def update(self, data: WebcamData):
         self._data = data
         self._event.set()
+        if self._wakeup:
+            self._wakeup.set()
+
+    def has_data(self) -> bool:
+        return self._data is not None
+
+    def take_data(self) -> WebcamData | None:
+        """Non-blocking version of get_data: returns None if there is no new data."""
+        data = self._data
+        self._data = None
+        self._event.clear()
+        return data
 
     async def get_data(self) -> WebcamData:
         await self._event.wait()
@@ -53,6 +70,9 @@ class WebcamBackend:
         :param callback: a callback interface to update the webcam data
         """
         self.callback = callback
+        self.encoding_policy: EncodingPolicy | None = None
+        if 'target_upload_secs' in config:
+            self.encoding_policy = EncodingPolicy(config)
 
     async def start(self):
         raise NotImplementedError()
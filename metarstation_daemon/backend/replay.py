@@ -0,0 +1,191 @@
+"""
+Backends replaying data previously recorded with the record_file option of the WS90 and Tapo backends.
+Useful for reproducing field behaviour and benchmarking without a radio or a camera.
+"""
+import asyncio
+import datetime
+import logging
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Iterator
+
+from bleak import BLEDevice, AdvertisementData
+
+from . import ffmpeg
+from .interface import SensorBackendQueue, WebcamBackend, WebcamBackendCallback
+from .ws90 import WS90SensorBackend
+from ..data import WebcamData
+from ..recording import Record, read_records, unpack_advertisement, RECORD_BLE_ADVERTISEMENT, RECORD_STREAM_SEGMENTS
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _ReplayClock:
+    """
+    Maps recorded timestamps to the current time, accelerated by the given speed factor.
+    A speed of 0 (or less) means "as fast as possible".
+    """
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        self._first_timestamp: float | None = None
+        self._start = 0.0
+
+    async def wait_for(self, timestamp: float):
+        if self.speed <= 0:
+            return
+
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+            self._start = time.monotonic()
+
+        delay = (timestamp - self._first_timestamp) / self.speed - (time.monotonic() - self._start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _iterate_records(path: str, kind: int, loop: bool) -> Iterator[Record]:
+    offset = 0.0
+    while True:
+        first_timestamp = last_timestamp = None
+        for record in read_records(path, kind):
+            if first_timestamp is None:
+                first_timestamp = record.timestamp
+            last_timestamp = record.timestamp
+            # shift timestamps when looping so that the clock keeps moving forward
+            record.timestamp += offset
+            yield record
+
+        if not loop or last_timestamp is None:
+            break
+        offset += last_timestamp - first_timestamp
+
+
+class _ReplayScanner:
+    """Stand-in for BleakScanner feeding recorded advertisements to the scanner callback."""
+
+    def __init__(self, callback: Callable[[BLEDevice, AdvertisementData], None],
+                 replay_file: str, speed: float, loop: bool, reading_ready: Callable[[], bool]):
+        """
+        :param reading_ready: tells if the callback completed a reading not yet collected by the backend
+        """
+        self._callback = callback
+        self._replay_file = replay_file
+        self._clock = _ReplayClock(speed)
+        self._loop = loop
+        self._reading_ready = reading_ready
+        self._scanning = asyncio.Event()
+        self._restarted = asyncio.Event()
+        self._replay_task: asyncio.Task | None = None
+
+    async def start(self):
+        self._scanning.set()
+        self._restarted.set()
+        if not self._replay_task:
+            self._replay_task = asyncio.get_running_loop().create_task(self._replay(), name='replay-scanner')
+
+    async def stop(self):
+        self._scanning.clear()
+
+    def close(self):
+        if self._replay_task:
+            self._replay_task.cancel()
+
+    async def _replay(self):
+        _LOGGER.info(f"Replaying advertisements from {self._replay_file} (speed {self._clock.speed})")
+        for record in _iterate_records(self._replay_file, RECORD_BLE_ADVERTISEMENT, self._loop):
+            await self._clock.wait_for(record.timestamp)
+            if not self._scanning.is_set():
+                if self._clock.speed > 0:
+                    # advertisements sent while not scanning are lost, just like in real life
+                    continue
+                await self._scanning.wait()
+
+            advertisement = unpack_advertisement(record.payload)
+            device = BLEDevice(advertisement.address, advertisement.local_name, None)
+            self._callback(device, AdvertisementData(
+                local_name=advertisement.local_name,
+                manufacturer_data=advertisement.manufacturer_data,
+                service_data=advertisement.service_data,
+                service_uuids=advertisement.service_uuids,
+                tx_power=advertisement.tx_power,
+                rssi=advertisement.rssi,
+                platform_data=(),
+            ))
+
+            if self._clock.speed <= 0 and self._reading_ready():
+                # as fast as possible, but no faster than the backend: wait for it to collect the reading and
+                # start scanning again, otherwise the next records would overwrite it
+                self._restarted.clear()
+                await self._restarted.wait()
+
+        _LOGGER.info("Advertisements replay finished")
+
+
+class ReplaySensorBackend(WS90SensorBackend):
+    """
+    WS90 backend with the BLE scanner replaced by a recording: decoding and aggregation are the same as the real thing.
+    The scanner interval is scaled by the replay speed.
+    """
+
+    def __init__(self, config, queue: SensorBackendQueue):
+        self._replay_file: str = config['replay_file']
+        self._replay_speed: float = config.get('replay_speed', 1.0)
+        self._replay_loop: bool = config.get('replay_loop', False)
+        super().__init__(config, queue)
+        if self.scan_scheduler and self._replay_speed > 0:
+            # readings are timestamped when replayed, the weather goes faster than that
+            self.scan_scheduler.time_scale = self._replay_speed
+
+    def _create_scanner(self):
+        return _ReplayScanner(self._callback, self._replay_file, self._replay_speed, self._replay_loop,
+                              lambda: self._data_event.is_set())
+
+    async def stop(self):
+        await super().stop()
+        self._scanner.close()
+
+    def _scanner_sleep_secs(self) -> float:
+        # also the adaptive interval, which is in recording time
+        if self._replay_speed > 0:
+            return super()._scanner_sleep_secs() / self._replay_speed
+        return 0
+
+
+class ReplayWebcamBackend(WebcamBackend):
+    """Webcam backend taking snapshots from recorded stream segments."""
+
+    def __init__(self, config, callback: WebcamBackendCallback):
+        super().__init__(config, callback)
+        self._replay_file: str = config['replay_file']
+        self._clock = _ReplayClock(config.get('replay_speed', 1.0))
+        self._replay_loop: bool = config.get('replay_loop', False)
+        self._tempdir = tempfile.mkdtemp('weather-station-replay')
+        self._replay_task: asyncio.Task | None = None
+
+    async def start(self):
+        _LOGGER.info(f"Replaying stream segments from {self._replay_file} (speed {self._clock.speed})")
+        self._replay_task = asyncio.get_running_loop().create_task(self._replay(), name='replay-webcam')
+
+    async def stop(self):
+        if self._replay_task:
+            self._replay_task.cancel()
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    async def _replay(self):
+        segment_file = Path(self._tempdir) / 'segment.ts'
+        for record in _iterate_records(self._replay_file, RECORD_STREAM_SEGMENTS, self._replay_loop):
+            await self._clock.wait_for(record.timestamp)
+            segment_file.write_bytes(record.payload)
+            encoding = self.encoding_policy.encoding() if self.encoding_policy else ffmpeg.DEFAULT_ENCODING
+            snapshot_data = await ffmpeg.take_snapshot(segment_file, encoding)
+            if snapshot_data is not None:
+                self.callback.update(WebcamData(
+                    timestamp=datetime.datetime.now(datetime.UTC),
+                    image_data=snapshot_data,
+                    image_type=encoding.image_type,
+                ))
+
+        _LOGGER.info("Stream segments replay finished")
@@ -0,0 +1,97 @@
+import collections
+import logging
+import math
+import statistics
+
+from ..data import SensorData
+
+_LOGGER = logging.getLogger(__name__)
+
+_LENGTHEN_FACTOR = 1.5
+"""Maximum growth of the interval at each step, so that it gets longer gradually after a gusty period."""
+
+
+class AdaptiveScanScheduler:
+    """
+    Chooses the interval between scans from the recent weather variability: scans are more frequent when wind
+    speed, gusts or direction vary a lot or when pressure is falling fast, and less frequent when conditions are
+    stable. Each variability indicator is normalized against a "high" threshold: the highest one decides the interval
+    between the configured bounds.
+    """
+
+    def __init__(self, config: dict):
+        self.min_interval_secs: float = config.get('scanner_min_sleep_secs', 10)
+        self.max_interval_secs: float = config.get('scanner_max_sleep_secs', 120)
+        self.wind_stdev_high: float = config.get('adaptive_wind_stdev_high', 2.0)
+        self.gust_spread_high: float = config.get('adaptive_gust_spread_high', 5.0)
+        self.direction_stdev_high: float = config.get('adaptive_direction_stdev_high', 30.0)
+        # the vane direction is just noise in calm air
+        self.direction_min_speed: float = config.get('adaptive_direction_min_speed', 1.0)
+        self.pressure_fall_high: float = config.get('adaptive_pressure_fall_high', 1.0)
+        self.pressure_window_secs: float = config.get('adaptive_pressure_window_mins', 60) * 60
+        self._readings: collections.deque[SensorData] = collections.deque(maxlen=config.get('adaptive_window', 10))
+        # pressure tendency is measured over a fixed time window rather than the last readings: over a few minutes
+        # (or a few readings at short intervals) the sensor resolution alone would look like a fast fall
+        self._pressures: collections.deque[tuple[float, float]] = collections.deque()
+        self.interval_secs: float = min(max(config.get('scanner_sleep_secs', self.max_interval_secs),
+                                            self.min_interval_secs), self.max_interval_secs)
+        self.variability = 0.0
+        self.time_scale = 1.0
+        """How fast the weather goes compared to the clock of the readings (e.g. accelerated replay).
+        The interval is in weather time."""
+
+    def add(self, data: SensorData) -> float:
+        """Add a reading and return the new scan interval."""
+        self._readings.append(data)
+        if data.pressure is not None:
+            self._pressures.append((data.timestamp.timestamp() * self.time_scale, data.pressure))
+            while self._pressures[-1][0] - self._pressures[0][0] > self.pressure_window_secs:
+                self._pressures.popleft()
+        self.variability = min(max(self._indicators().values(), default=0.0), 1.0)
+
+        target = self.max_interval_secs - self.variability * (self.max_interval_secs - self.min_interval_secs)
+        # shorten immediately, lengthen gradually
+        interval = min(target, self.interval_secs * _LENGTHEN_FACTOR)
+        if round(interval) != round(self.interval_secs):
+            _LOGGER.info(f"Scan interval now {interval:.0f}s (variability {self.variability:.2f})")
+        self.interval_secs = interval
+        return interval
+
+    def status(self) -> dict:
+        return {
+            'interval_secs': round(self.interval_secs, 1),
+            'variability': round(self.variability, 2),
+            'indicators': {name: round(value, 2) for name, value in self._indicators().items()},
+        }
+
+    def _indicators(self) -> dict[str, float]:
+        """Variability indicators, normalized (1 = high variability)."""
+        indicators = {}
+
+        speeds = [r.wind_speed for r in self._readings if r.wind_speed is not None]
+        if len(speeds) > 1:
+            indicators['wind_speed'] = statistics.stdev(speeds) / self.wind_stdev_high
+
+        spreads = [r.gust_speed - r.wind_speed for r in self._readings
+                   if r.gust_speed is not None and r.wind_speed is not None]
+        if spreads:
+            indicators['gust_spread'] = statistics.fmean(spreads) / self.gust_spread_high
+
+        directions = [math.radians(r.wind_direction) for r in self._readings
+                      if r.wind_direction is not None and r.wind_speed is not None
+                      and r.wind_speed >= self.direction_min_speed]
+        if len(directions) > 1:
+            # circular standard deviation
+            resultant = math.hypot(sum(math.sin(d) for d in directions),
+                                   sum(math.cos(d) for d in directions)) / len(directions)
+            stdev = math.degrees(math.sqrt(-2 * math.log(max(resultant, 1e-9))))
+            indicators['wind_direction'] = stdev / self.direction_stdev_high
+
+        # wait until readings cover at least half of the window
+        if self._pressures and self._pressures[-1][0] - self._pressures[0][0] >= self.pressure_window_secs / 2:
+            # least squares slope (hPa/h), only falling pressure counts
+            slope = statistics.linear_regression([t / 3600 for t, _ in self._pressures],
+                                                 [p for _, p in self._pressures]).slope
+            indicators['pressure_fall'] = max(-slope, 0) / self.pressure_fall_high
+
+        return indicators
@@ -1,8 +1,10 @@
 import asyncio
 import datetime
+import functools
+import json
 import logging
+import random
 import shutil
-import subprocess
 import tempfile
 from pathlib import Path
 
@@ -11,22 +13,27 @@ from kasa import Discover as kasa_Discover, Credentials as kasa_Credentials
 from pytapo import Tapo
 from pytapo.media_stream.streamer import Streamer
 
+from . import ffmpeg
 from .interface import WebcamBackend, WebcamBackendCallback
 from ..data import WebcamData
+from ..recording import RecordWriter
+from .. import supervisor
 
 _LOGGER = logging.getLogger(__name__)
 _STREAM_FILENAME = "stream.m3u8"
-_IMAGE_TYPE = 'image/jpeg'
 _STREAM_SETTLE_WAIT_SECS = 10
 
+_RETRY_MIN_SECS = 1
+_RETRY_MAX_SECS = 120
 
-async def _print_ffmpeg_logs(stderr):
-    _LOGGER.debug('ffmpeg snapshot output:')
-    while True:
-        line = await stderr.readline()
-        if not line:
-            break
-        _LOGGER.debug(f"  {line.decode().strip()}")
+_REDISCOVER_AFTER_FAILURES = 3
+"""Consecutive connection failures after which the camera is discovered again (it might have a new address)."""
+
+
+def _backoff_secs(failures: int) -> float:
+    """Exponential backoff with jitter, so that retries don't happen in lockstep with the camera booting up."""
+    delay = min(_RETRY_MIN_SECS * 2 ** (failures - 1), _RETRY_MAX_SECS)
+    return random.uniform(delay / 2, delay)
 
 
 class TapoStreamer:
@@ -37,7 +44,9 @@ class TapoStreamer:
                  discovery_interface: str,
                  discovery_username: str,
                  discovery_password: str,
-                 tapo_args: dict):
+                 tapo_args: dict,
+                 state_file: str | None = None,
+                 rediscover_after: int = _REDISCOVER_AFTER_FAILURES):
         self.quality = quality
         self._log_callback = log_callback
         self._connect_callback = connect_callback
@@ -46,6 +55,8 @@ class TapoStreamer:
         self._discovery_username = discovery_username
         self._discovery_password = discovery_password
         self._tapo_args = tapo_args
+        self._state_file = Path(state_file) if state_file else None
+        self._rediscover_after = rediscover_after
         self._connect_task: asyncio.Task | None = None
         self._tapo: Tapo | None = None
         self._streamer: Streamer | None = None
@@ -53,12 +64,9 @@ class TapoStreamer:
         self.ready = False
 
     async def start(self):
-        if 'host' in self._tapo_args and self._tapo_args['host'] is not None:
-            self._connect_task = asyncio.get_running_loop().create_task(self._connect())
-        elif self._discovery_interface is not None:
-            self._connect_task = asyncio.get_running_loop().create_task(self._discover())
-        else:
+        if self._tapo_args.get('host') is None and self._discovery_interface is None:
             raise ValueError('Provide either camera host or discovery interface')
+        self._connect_task = asyncio.get_running_loop().create_task(self._connect(), name='tapo-connect')
 
     async def stop(self):
         self._shutdown_event.set()
@@ -94,8 +102,24 @@ class TapoStreamer:
             except:
                 pass
 
-    async def _discover(self):
-        while not self._shutdown_event.set():
+    def read_stream_segments(self) -> bytes:
+        """Read all the segments currently listed in the stream playlist, concatenated (MPEG-TS allows that)."""
+        playlist = Path(self._tempdir) / _STREAM_FILENAME
+        segments = [line.strip() for line in playlist.read_text().splitlines()
+                    if line.strip() and not line.startswith('#')]
+        return b''.join((Path(self._tempdir) / segment).read_bytes() for segment in segments)
+
+    def _can_discover(self) -> bool:
+        # a configured address always wins over discovery
+        return self._tapo_args.get('host') is None and self._discovery_interface is not None
+
+    def _start_discovery(self) -> asyncio.Task:
+        return asyncio.get_running_loop().create_task(self._discover(), name='tapo-discover')
+
+    async def _discover(self) -> str:
+        """Discover the camera on the local network, retrying until found. Returns the camera host."""
+        failures = 0
+        while True:
             _LOGGER.debug(f'Discovering camera on interface {self._discovery_interface}')
             if self._discovery_username and self._discovery_password:
                 credentials = kasa_Credentials(
@@ -112,44 +136,107 @@ class TapoStreamer:
                     discovery_timeout=10,
                 )
                 if len(devices) > 0:
-                    # provide the host to the Tapo constructor and continue with normal connection
-                    self._tapo_args['host'] = next(iter(devices.keys()))
-                    await self.start()
-                    break
-
+                    host = next(iter(devices.keys()))
+                    _LOGGER.info(f'Discovered camera at address {host}')
+                    return host
+                _LOGGER.warning('No camera found during discovery')
             except asyncio.CancelledError:
-                break
+                raise
             except:
                 _LOGGER.warning('Error discovering camera', exc_info=True)
-                try:
-                    # TODO exponential backoff?
-                    await asyncio.sleep(10)
-                except asyncio.CancelledError:
-                    break
 
-    async def _connect(self):
-        _LOGGER.debug(f'Connecting to camera at address {self._tapo_args["host"]}')
-        while not self._shutdown_event.set():
-            try:
-                self._tapo = await asyncio.get_running_loop().run_in_executor(None, self._create_tapo)
-                self.ready = True
+            failures += 1
+            await asyncio.sleep(_backoff_secs(failures))
 
-                if self._connect_callback:
-                    self._connect_callback()
-                break
-
-            except OSError as e:
-                # network error, queue a retry after some time
-                _LOGGER.warning(f'Tapo connect failed! {e}')
+    async def _connect(self):
+        state = self._load_state()
+        host = self._tapo_args.get('host') or state.get('host')
+        # negotiated parameters are only valid for the camera they were negotiated with
+        session_args = state.get('session', {}) if state.get('host') == host else {}
+
+        discovery: asyncio.Task | None = None
+        if self._can_discover():
+            # the cached address is tried right away, discovery runs in parallel in case the camera moved
+            discovery = self._start_discovery()
+
+        failures = 0
+        try:
+            while not self._shutdown_event.is_set():
+                if discovery and (host is None or discovery.done()):
+                    discovered = await discovery
+                    discovery = None
+                    if discovered != host:
+                        host = discovered
+                        session_args = {}
+
+                _LOGGER.debug(f'Connecting to camera at address {host}')
                 try:
-                    # TODO exponential backoff?
-                    await asyncio.sleep(10)
-                except asyncio.CancelledError:
+                    self._tapo = await asyncio.get_running_loop().run_in_executor(
+                        None, functools.partial(self._create_tapo, host, session_args))
+                    self.ready = True
+                    self._save_state(host)
+
+                    if self._connect_callback:
+                        self._connect_callback()
                     break
 
-    def _create_tapo(self):
+                except Exception as e:
+                    # network error (or stale session parameters), queue a retry after some time
+                    failures += 1
+                    session_args = {}
+                    delay = _backoff_secs(failures)
+                    _LOGGER.warning(f'Tapo connect failed ({failures} attempts), retrying in {delay:.1f}s: {e}')
+
+                    if not discovery and self._can_discover() and failures % self._rediscover_after == 0:
+                        _LOGGER.info(f'Camera unreachable at address {host}, discovering again')
+                        discovery = self._start_discovery()
+
+                    if discovery:
+                        # retry as soon as discovery completes
+                        await asyncio.wait([discovery], timeout=delay)
+                    else:
+                        await asyncio.sleep(delay)
+
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if discovery:
+                discovery.cancel()
+
+    def _create_tapo(self, host: str, session_args: dict):
         """Called from an executor because the Tapo constructor will block for connecting to the camera."""
-        return Tapo(**self._tapo_args)
+        return Tapo(**(self._tapo_args | {'host': host} | session_args))
+
+    def _load_state(self) -> dict:
+        if not self._state_file:
+            return {}
+        try:
+            with open(self._state_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            _LOGGER.warning(f'Unable to read camera state from {self._state_file}', exc_info=True)
+            return {}
+
+    def _save_state(self, host: str):
+        if not self._state_file:
+            return
+        state = {
+            'host': host,
+            # skips protocol detection when connecting again
+            'session': {
+                'isKLAP': self._tapo.isKLAP,
+                'KLAPVersion': self._tapo.KLAPVersion,
+            },
+        }
+        try:
+            # write and rename, so that a crash never leaves a truncated file behind
+            temp_file = self._state_file.with_name(self._state_file.name + '.tmp')
+            temp_file.write_text(json.dumps(state))
+            temp_file.replace(self._state_file)
+        except OSError:
+            _LOGGER.warning(f'Unable to write camera state to {self._state_file}', exc_info=True)
 
 
 class TapoWebcamBackend(WebcamBackend):
@@ -173,6 +260,8 @@ class TapoWebcamBackend(WebcamBackend):
                 'password': config['cloud_password'],
                 'cloudPassword': config['cloud_password'],
             },
+            state_file=config.get('state_file', None),
+            rediscover_after=config.get('rediscover_after', _REDISCOVER_AFTER_FAILURES),
         )
         self._snapshot_last: float = 0
         """Last snapshot timestamp. It will be compared against the stream files to see if the image has actually been produced."""
@@ -180,13 +269,17 @@ class TapoWebcamBackend(WebcamBackend):
         self._snapshot_task = None
         self._shutdown_event = asyncio.Event()
 
+        self._recorder: RecordWriter | None = None
+        if 'record_file' in config:
+            self._recorder = RecordWriter(config['record_file'])
+
     def streamer_log_callback(self, status):
         if self._debug:
             _LOGGER.debug(status)
 
     def streamer_connected(self):
         _LOGGER.info('Tapo webcam connected')
-        self._snapshot_task = asyncio.get_running_loop().create_task(self._collect_snapshot_start())
+        self._snapshot_task = supervisor.spawn('tapo-snapshot', self._collect_snapshot_start)
 
     async def start(self):
         _LOGGER.info(f"Tapo webcam starting ({self._tapo.quality} quality)")
@@ -203,6 +296,9 @@ class TapoWebcamBackend(WebcamBackend):
         # cleanup temporary files
         shutil.rmtree(self._tempdir, ignore_errors=True)
 
+        if self._recorder:
+            self._recorder.close()
+
     async def _collect_snapshot_start(self):
         _LOGGER.debug("Starting webcam snapshot collection")
 
@@ -231,42 +327,15 @@ class TapoWebcamBackend(WebcamBackend):
             await asyncio.sleep(self._snapshot_interval_secs - _STREAM_SETTLE_WAIT_SECS)
 
     async def _take_snapshot(self):
-        """
-        ffmpeg -i stream_output.m3u8 -vframes 1 -q:v 10 snapshot.jpg, but with pipes.
-        """
-
         if not self._stream_changed():
             _LOGGER.debug('Stream did not change, not taking snapshot')
             return
 
         _LOGGER.debug("Taking snapshot from webcam")
 
-        cmd = [
-            'ffmpeg',
-            '-i',
-            str(self._stream_file()),
-            '-an',
-            '-c:v',
-            'mjpeg',
-            '-pix_fmt',
-            'yuvj420p',
-            '-vframes',
-            '1',
-            '-q:v',
-            '10',
-            '-f',
-            'image2pipe',
-            'pipe:1',
-        ]
-        _LOGGER.debug(f"cmdline: {cmd}")
-        self._snapshot_process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        snapshot_data = await self._snapshot_process.stdout.read()
-        await self._snapshot_process.wait()
-        if self._snapshot_process.returncode == 0:
+        encoding = self.encoding_policy.encoding() if self.encoding_policy else ffmpeg.DEFAULT_ENCODING
+        snapshot_data = await ffmpeg.take_snapshot(self._stream_file(), encoding)
+        if snapshot_data is not None:
             # TEST write to file
             if self._debug:
                 with open(Path(self._tempdir) / "snapshot.jpg", "wb") as f:
@@ -274,10 +343,18 @@ class TapoWebcamBackend(WebcamBackend):
             self.callback.update(WebcamData(
                 timestamp=datetime.datetime.now(datetime.UTC),
                 image_data=snapshot_data,
-                image_type=_IMAGE_TYPE,
+                image_type=encoding.image_type,
             ))
-        else:
-            await _print_ffmpeg_logs(self._snapshot_process.stderr)
+
+        if self._recorder:
+            try:
+                # reading and writing the segments is blocking I/O
+                await asyncio.get_running_loop().run_in_executor(None, self._record_stream_segments)
+            except Exception:
+                _LOGGER.warning("Unable to record stream segments", exc_info=True)
+
+    def _record_stream_segments(self):
+        self._recorder.write_stream_segments(self._tapo.read_stream_segments())
 
     def _stream_changed(self) -> bool:
         stream_file = self._stream_file()
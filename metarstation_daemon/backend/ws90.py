@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import datetime
 import logging
 
@@ -9,7 +10,10 @@ from habluetooth import BluetoothServiceInfoBleak
 from sensor_state_data import SensorValue, DeviceKey
 
 from .interface import SensorBackend, SensorBackendQueue
+from .scheduling import AdaptiveScanScheduler
 from ..data import SensorData
+from ..recording import RecordWriter
+from .. import supervisor
 
 SERVICE_DATA_UUID = '6720fc43-27ed-4c02-ac27-e4ea85b5bcfd'
 """
@@ -49,21 +53,30 @@ class WS90SensorBackend(SensorBackend):
         super().__init__(config, queue)
         self.bt_address: str = config['bt_address']
         self.scanner_sleep_secs: int = config.get('scanner_sleep_secs', 60)
-        # TODO passive scan doesn't work without some tricks; it's probably better to just use active scan at regular intervals anyway
-        self._scanner = BleakScanner(self._callback,
-                                     scanning_mode='active',
-                                     # disable specific service filtering for now
-                                     #service_uuids=[SERVICE_DATA_UUID]
-                                     )
+        self.scan_scheduler: AdaptiveScanScheduler | None = None
+        if config.get('adaptive_scan', False):
+            self.scan_scheduler = AdaptiveScanScheduler(config)
+        self._scanner = self._create_scanner()
+        self._recorder: RecordWriter | None = None
+        if 'record_file' in config:
+            self._recorder = RecordWriter(config['record_file'])
         self._packet1_received = False
         self._packet2_received = False
         self._latest_data = SensorData()
         self._data_event = asyncio.Event()
-        self._data_collect_task: asyncio.Task | None = None
+        self._data_collect_task: supervisor.SupervisedTask | asyncio.Task | None = None
+
+    def _create_scanner(self):
+        # TODO passive scan doesn't work without some tricks; it's probably better to just use active scan at regular intervals anyway
+        return BleakScanner(self._callback,
+                            scanning_mode='active',
+                            # disable specific service filtering for now
+                            #service_uuids=[SERVICE_DATA_UUID]
+                            )
 
     async def start(self):
         _LOGGER.debug(f"WS90 scanner for {self.bt_address} starting")
-        self._data_collect_task = asyncio.get_running_loop().create_task(self._collect_data_start())
+        self._data_collect_task = supervisor.spawn('ws90-collect-data', self._collect_data_start)
 
     async def stop(self):
         _LOGGER.debug("WS90 scanner stopping")
@@ -71,28 +84,42 @@ class WS90SensorBackend(SensorBackend):
         self._data_event.set()
         if self._data_collect_task:
             self._data_collect_task.cancel()
+        if self._recorder:
+            self._recorder.close()
 
     async def _collect_data_start(self):
-        while True:
-            # start scanning: the callback will trigger the data event when ready
-            await self._scanner.start()
-
-            # wait for the data event from the scanner callback
-            await asyncio.wait_for(self._data_event.wait(), timeout=None)
-            self._data_event.clear()
-
-            if self._packet1_received and self._packet2_received:
-                # data is ready: push to data collector
-                self._push_sensor_value()
-            else:
-                # shutting down
-                break
-
-            # stop scanning and wait for the interval
-            await self._scanner.stop()
-            await asyncio.sleep(self.scanner_sleep_secs)
+        try:
+            while True:
+                # start scanning: the callback will trigger the data event when ready
+                await self._scanner.start()
+
+                # wait for the data event from the scanner callback
+                await asyncio.wait_for(self._data_event.wait(), timeout=None)
+                self._data_event.clear()
+
+                if self._packet1_received and self._packet2_received:
+                    # data is ready: push to data collector
+                    self._push_sensor_value()
+                else:
+                    # shutting down
+                    break
+
+                # stop scanning and wait for the interval
+                await self._scanner.stop()
+                await asyncio.sleep(self._scanner_sleep_secs())
+        finally:
+            # leave the scanner stopped, also when cancelled (the supervisor might restart this loop)
+            with contextlib.suppress(Exception):
+                await self._scanner.stop()
+
+    def _scanner_sleep_secs(self) -> float:
+        if self.scan_scheduler:
+            return self.scan_scheduler.interval_secs
+        return self.scanner_sleep_secs
 
     def _push_sensor_value(self):
+        if self.scan_scheduler:
+            self.scan_scheduler.add(self._latest_data)
         self.queue.push(self._latest_data)
         # reset buffer object
         self._latest_data = SensorData()
@@ -115,6 +142,9 @@ class WS90SensorBackend(SensorBackend):
             _LOGGER.warning("No advertisement data")
             return
 
+        if self._recorder:
+            self._recorder.write_advertisement(device.address, advertisement_data)
+
         service_info = (BluetoothServiceInfoBleak
                         .from_device_and_advertisement_data(device, advertisement_data,
                                                             "local", monotonic_time_coarse(), True))
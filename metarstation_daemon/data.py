@@ -1,4 +1,5 @@
 import datetime
+import json
 from dataclasses import dataclass, field
 
 from dataclasses_json import dataclass_json, config
@@ -8,8 +9,8 @@ BATTERY_VALUE_AC = -1
 """Battery value when AC is connected."""
 
 
-@dataclass(kw_only=True)
 @dataclass_json
+@dataclass(kw_only=True)
 class SensorData(dict):
 
     timestamp: datetime.datetime = field(
@@ -58,6 +59,20 @@ class SensorData(dict):
     precipitation: float|None = None
     """Precipitation (mm/h)."""
 
+    qc_flags: dict[str, str]|None = field(default=None, metadata=config(exclude=lambda x: x is None))
+    """Quality control failures (field name -> failed check) for suspect values. Not serialized when None."""
+
+    def to_json_bytes(self) -> bytes:
+        """
+        Compact JSON serialization, computed once and cached: the object must not be modified afterwards.
+        Allows the same bytes to be shared by all frontends.
+        """
+        try:
+            return self._json_bytes
+        except AttributeError:
+            self._json_bytes = json.dumps(self.to_dict(), separators=(',', ':')).encode()
+            return self._json_bytes
+
 
 @dataclass(kw_only=True)
 class WebcamData:
@@ -70,3 +85,22 @@ class WebcamData:
 
     image_type: str
     """Image MIME type."""
+
+
+@dataclass(kw_only=True)
+class TimelapseData:
+
+    start: datetime.datetime
+    """Timestamp of the first frame."""
+
+    end: datetime.datetime
+    """Timestamp of the last frame."""
+
+    frames: int
+    """Number of frames in the clip."""
+
+    video_data: bytes
+    """Encoded clip."""
+
+    video_type: str
+    """Video MIME type."""
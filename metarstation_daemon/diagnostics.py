@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import datetime
+import logging
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, TextIO
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DURATION_SECS = 60
+"""Default duration of a diagnostics session."""
+
+DEFAULT_SAMPLE_INTERVAL_MS = 10
+"""Default sampling interval of the profiler."""
+
+DEFAULT_SLOW_CALLBACK_MS = 100
+"""Default threshold for asyncio slow callback warnings."""
+
+
+class SamplingProfiler:
+    """
+    A low-overhead sampling profiler: a background thread periodically samples the stack of the profiled thread.
+    Results are collected as collapsed stacks (one line per stack, frames separated by semicolons, followed by the
+    sample count), ready to be fed to flamegraph tools.
+    """
+
+    def __init__(self, thread_id: int, interval_secs: float):
+        self._thread_id = thread_id
+        self._interval_secs = interval_secs
+        self._samples: collections.Counter[str] = collections.Counter()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def write_collapsed(self, fp: TextIO):
+        for stack, count in self._samples.most_common():
+            fp.write(f"{stack} {count}\n")
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval_secs):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                break
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._samples[';'.join(reversed(stack))] += 1
+
+
+def _describe_awaits(task: asyncio.Task) -> list[str]:
+    """Follow the chain of awaitables the task is currently suspended on."""
+    awaits = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        awaits.append(repr(awaitable))
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+    return awaits
+
+
+def dump_tasks(fp: TextIO, loop: asyncio.AbstractEventLoop):
+    """Write a description of all running tasks, their stacks and what they are waiting for."""
+    tasks = sorted(asyncio.all_tasks(loop), key=lambda t: t.get_name())
+    fp.write(f"{len(tasks)} tasks\n")
+    for task in tasks:
+        fp.write(f"\n=== {task.get_name()}: {task!r}\n")
+        for awaited in _describe_awaits(task):
+            fp.write(f"  awaiting {awaited}\n")
+        task.print_stack(file=fp)
+
+
+class Diagnostics:
+    """
+    On-demand diagnostics, triggered by signals:
+    * SIGUSR1 toggles a diagnostics session: sampling profiler and asyncio debug mode (with slow callback logging)
+      are enabled for a limited time, then results are written to the output directory.
+    * SIGUSR2 writes a dump of all running tasks to the output directory.
+    """
+
+    def __init__(self, config: dict):
+        self.output_dir = Path(config.get('output_dir', '/tmp/metarstation-diagnostics'))
+        self.duration_secs: int = config.get('duration_secs', DEFAULT_DURATION_SECS)
+        self.sample_interval_ms: int = config.get('sample_interval_ms', DEFAULT_SAMPLE_INTERVAL_MS)
+        self.slow_callback_ms: int = config.get('slow_callback_ms', DEFAULT_SLOW_CALLBACK_MS)
+        self._status_sources: dict[str, Callable[[], object]] = {}
+        self._profiler: SamplingProfiler | None = None
+        self._log_handler: logging.Handler | None = None
+        self._session_name: str | None = None
+        self._session_timer: asyncio.TimerHandle | None = None
+        self._loop_debug = False
+        self._loop_slow_callback_duration = 0.1
+
+    def add_status_source(self, name: str, source: Callable[[], object]):
+        """Register a callable whose result will be included in task dumps."""
+        self._status_sources[name] = source
+
+    def clear_status_sources(self):
+        self._status_sources.clear()
+
+    def toggle_session(self):
+        if self._profiler:
+            self.stop_session()
+        else:
+            self.start_session()
+
+    def start_session(self):
+        loop = asyncio.get_running_loop()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._session_name = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        _LOGGER.info(f"Starting diagnostics session {self._session_name} for {self.duration_secs} seconds")
+
+        # asyncio debug mode: slow callbacks and never-retrieved exceptions are logged by the asyncio logger
+        self._loop_debug = loop.get_debug()
+        self._loop_slow_callback_duration = loop.slow_callback_duration
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_callback_ms / 1000
+        self._log_handler = logging.FileHandler(self.output_dir / f"asyncio-{self._session_name}.log")
+        self._log_handler.setFormatter(logging.Formatter("[%(asctime)s] %(name)s %(levelname)s - %(message)s"))
+        logging.getLogger('asyncio').addHandler(self._log_handler)
+
+        self._profiler = SamplingProfiler(threading.get_ident(), self.sample_interval_ms / 1000)
+        self._profiler.start()
+        self._session_timer = loop.call_later(self.duration_secs, self.stop_session)
+
+    def stop_session(self):
+        if not self._profiler:
+            return
+
+        if self._session_timer:
+            self._session_timer.cancel()
+            self._session_timer = None
+
+        self._profiler.stop()
+        profile_file = self.output_dir / f"profile-{self._session_name}.collapsed"
+        with open(profile_file, 'w') as fp:
+            self._profiler.write_collapsed(fp)
+        self._profiler = None
+
+        loop = asyncio.get_running_loop()
+        loop.set_debug(self._loop_debug)
+        loop.slow_callback_duration = self._loop_slow_callback_duration
+        logging.getLogger('asyncio').removeHandler(self._log_handler)
+        self._log_handler.close()
+        self._log_handler = None
+
+        self.dump_tasks(f"tasks-{self._session_name}.txt")
+        _LOGGER.info(f"Diagnostics session {self._session_name} written to {self.output_dir}")
+
+    def dump_tasks(self, filename: str | None = None):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if not filename:
+            filename = f"tasks-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+
+        start = time.monotonic()
+        with open(self.output_dir / filename, 'w') as fp:
+            for name, source in self._status_sources.items():
+                try:
+                    fp.write(f"{name}: {source()}\n")
+                except Exception:
+                    fp.write(f"{name}: error\n{traceback.format_exc()}\n")
+            dump_tasks(fp, asyncio.get_running_loop())
+        _LOGGER.info(f"Task dump written to {self.output_dir / filename} in {time.monotonic() - start:.3f}s")
@@ -0,0 +1,20 @@
+from .interface import DataFrontend
+
+
+def create_frontend(config: dict) -> DataFrontend:
+    """Create a frontend from its configuration section (frontend modules are imported only when needed)."""
+    frontend_type = config.get('type', 'http')
+    if frontend_type == 'http':
+        from .http import HTTPDataFrontend
+        return HTTPDataFrontend(config)
+    elif frontend_type == 'local':
+        from .local import LocalDataFrontend
+        return LocalDataFrontend(config)
+    elif frontend_type == 'mqtt':
+        from .mqtt import MqttDataFrontend
+        return MqttDataFrontend(config)
+    elif frontend_type == 'fanout':
+        from .fanout import FanoutDataFrontend
+        return FanoutDataFrontend(config)
+    else:
+        raise ValueError(f'Unknown frontend type: {frontend_type}')
@@ -0,0 +1,225 @@
+import asyncio
+import collections
+import contextlib
+import itertools
+import logging
+import time
+
+from .interface import DataFrontend
+from ..data import SensorData, WebcamData, TimelapseData
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_LIMIT = 500
+"""Default limit of the per-destination queue of readings."""
+
+DEFAULT_BATCH_SIZE = 50
+"""Default maximum number of readings sent in one go to a destination."""
+
+TIMELAPSE_QUEUE_LIMIT = 24
+"""Limit of the per-destination queue of time-lapse clips."""
+
+TIMELAPSE_MAX_ATTEMPTS = 5
+"""Attempts at sending a time-lapse clip to a destination before dropping it, so that it doesn't block the queue."""
+
+
+class _Destination:
+    """A frontend with its own queue, retry state and worker task."""
+
+    def __init__(self, name: str, frontend: DataFrontend, config: dict):
+        self.name = name
+        self.frontend = frontend
+        self.queue_limit: int = config.get('queue_limit', DEFAULT_QUEUE_LIMIT)
+        self.batch_size: int = config.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.retry_min_secs: float = config.get('retry_min_secs', 1)
+        self.retry_max_secs: float = config.get('retry_max_secs', 300)
+        self.readings: collections.deque[SensorData] = collections.deque()
+        self.webcam: WebcamData | None = None
+        self.timelapses: collections.deque[TimelapseData] = collections.deque(maxlen=TIMELAPSE_QUEUE_LIMIT)
+        self.timelapse_attempts = 0
+        self.timelapses_dropped = 0
+        self.retry_secs = 0.0
+        # images have their own retry state: a rejected image must not hold back readings
+        self.media_retry_secs = 0.0
+        self._media_retry_at = 0.0
+        self.dropped = 0
+        self.failures = 0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run(), name=f'fanout-{self.name}')
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def push_data(self, data: SensorData):
+        self.readings.append(data)
+        self._trim()
+        self._wakeup.set()
+
+    def push_webcam(self, data: WebcamData):
+        # only the latest snapshot is worth sending
+        self.webcam = data
+        self._wakeup.set()
+
+    def push_timelapse(self, data: TimelapseData):
+        self.timelapses.append(data)
+        self._wakeup.set()
+
+    def status(self) -> dict:
+        return {
+            'queued': len(self.readings),
+            'webcam_pending': self.webcam is not None,
+            'timelapses_queued': len(self.timelapses),
+            'timelapses_dropped': self.timelapses_dropped,
+            'dropped': self.dropped,
+            'failures': self.failures,
+            'retry_secs': self.retry_secs,
+            'media_retry_secs': self.media_retry_secs,
+        }
+
+    def _trim(self):
+        # drop the oldest readings when over limit
+        while len(self.readings) > self.queue_limit:
+            self.readings.popleft()
+            self.dropped += 1
+
+    async def _run(self):
+        while True:
+            timeout = None
+            if self.webcam or self.timelapses:
+                # retry images when their backoff expires
+                timeout = max(self._media_retry_at - time.monotonic(), 0)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            self._wakeup.clear()
+
+            while self.readings or self._media_due():
+                try:
+                    await self._send_pending()
+                    self.retry_secs = 0
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.failures += 1
+                    self.retry_secs = min(max(self.retry_secs * 2, self.retry_min_secs), self.retry_max_secs)
+                    _LOGGER.warning(f"Failed to send to {self.name}, retrying in {self.retry_secs}s", exc_info=True)
+                    await asyncio.sleep(self.retry_secs)
+
+    async def _send_pending(self):
+        if self.readings:
+            batch = list(itertools.islice(self.readings, self.batch_size))
+            for _ in batch:
+                self.readings.popleft()
+            try:
+                await self.frontend.send_data(batch)
+            except BaseException:
+                # put the batch back in front of the queue (the oldest readings might be dropped)
+                self.readings.extendleft(reversed(batch))
+                self._trim()
+                raise
+
+        if self._media_due():
+            try:
+                await self._send_media()
+                self.media_retry_secs = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failures += 1
+                self.media_retry_secs = min(max(self.media_retry_secs * 2, self.retry_min_secs),
+                                            self.retry_max_secs)
+                self._media_retry_at = time.monotonic() + self.media_retry_secs
+                _LOGGER.warning(f"Failed to send images to {self.name}, retrying in {self.media_retry_secs}s",
+                                exc_info=True)
+
+    def _media_due(self) -> bool:
+        return bool(self.webcam or self.timelapses) and time.monotonic() >= self._media_retry_at
+
+    async def _send_media(self):
+        if self.webcam:
+            webcam = self.webcam
+            self.webcam = None
+            try:
+                await self.frontend.send_webcam(webcam)
+            except BaseException:
+                # a newer snapshot might have arrived in the meantime
+                if not self.webcam:
+                    self.webcam = webcam
+                raise
+
+        if self.timelapses:
+            clip = self.timelapses[0]
+            try:
+                self.timelapse_attempts += 1
+                await self.frontend.send_timelapse(clip)
+            except Exception:
+                if self.timelapse_attempts < TIMELAPSE_MAX_ATTEMPTS:
+                    raise
+                _LOGGER.warning(f"Failed to send time-lapse clip to {self.name} {self.timelapse_attempts} times, "
+                                f"dropping it", exc_info=True)
+                self.timelapses_dropped += 1
+
+            self.timelapse_attempts = 0
+            # the clip might have been pushed out of the queue by newer ones in the meantime
+            if self.timelapses and self.timelapses[0] is clip:
+                self.timelapses.popleft()
+
+
+class FanoutDataFrontend(DataFrontend):
+    """
+    Sends data to multiple frontends concurrently. Each destination has its own bounded queue, retry state and batching,
+    so a slow or unreachable destination doesn't hold back the others.
+    Readings are serialized once and the same bytes are shared by all destinations.
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        # avoid circular imports
+        from . import create_frontend
+
+        self._destinations = [
+            _Destination(name, create_frontend(destination_config), destination_config)
+            for name, destination_config in config['destinations'].items()
+        ]
+        for destination in self._destinations:
+            destination.frontend.upload_listener = self._report_upload
+
+    async def setup(self):
+        _LOGGER.debug(f"Fan-out frontend starting ({', '.join(d.name for d in self._destinations)})")
+        for destination in self._destinations:
+            await destination.frontend.setup()
+            destination.start()
+
+    async def close(self):
+        for destination in self._destinations:
+            destination.stop()
+            await destination.frontend.close()
+
+    async def send_data(self, data: list[SensorData]):
+        for reading in data:
+            # serialize once: the bytes are cached in the reading and shared by all destinations
+            reading.to_json_bytes()
+            for destination in self._destinations:
+                destination.push_data(reading)
+
+    async def send_webcam(self, data: WebcamData):
+        for destination in self._destinations:
+            destination.push_webcam(data)
+
+    async def send_timelapse(self, data: TimelapseData):
+        for destination in self._destinations:
+            destination.push_timelapse(data)
+
+    @property
+    def accepted_image_types(self) -> set[str] | None:
+        # only image types supported by all destinations
+        types = [destination.frontend.accepted_image_types for destination in self._destinations]
+        if not types or None in types:
+            return None
+        return set.intersection(*types)
+
+    def status(self) -> dict:
+        return {destination.name: destination.status() for destination in self._destinations}
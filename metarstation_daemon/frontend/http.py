@@ -1,10 +1,11 @@
 import logging
+import time
 
 import httpx
 from httpx import URL
 
 from .interface import DataFrontend
-from ..data import SensorData, WebcamData
+from ..data import SensorData, WebcamData, TimelapseData
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -18,6 +19,7 @@ class HTTPDataFrontend(DataFrontend):
         super().__init__(config)
         self.push_url: str = config['data_url']
         self.image_url: str = config['image_url']
+        self.timelapse_url: str | None = config.get('timelapse_url', None)
         self.api_token: str = config['api_token']
         self.timeout_secs: int = config.get('timeout_secs', 10)
 
@@ -29,7 +31,10 @@ class HTTPDataFrontend(DataFrontend):
         _LOGGER.debug(f"Sending data: {data}")
         async with self._httpclient() as client:
             auth = BearerTokenAuth(self.api_token)
-            r = await client.post(self.push_url, json=[x.to_dict() for x in data[-self.DATA_LIMIT:]], auth=auth)
+            content = b'[' + b','.join(x.to_json_bytes() for x in data[-self.DATA_LIMIT:]) + b']'
+            r = await client.post(self.push_url, content=content, auth=auth, headers={
+                'content-type': 'application/json',
+            })
             if r.status_code not in (200, 201):
                 # TODO custom exception maybe?
                 raise RuntimeError(f"HTTP request failed with status code {r.status_code}")
@@ -39,9 +44,38 @@ class HTTPDataFrontend(DataFrontend):
         async with self._httpclient() as client:
             auth = BearerTokenAuth(self.api_token)
             image_url = URL(self.image_url).copy_add_param('timestamp', data.timestamp.isoformat())
+            upload_start = time.perf_counter()
             r = await client.post(image_url, content=data.image_data, auth=auth, headers={
                 'content-type': data.image_type,
             })
+            elapsed_secs = time.perf_counter() - upload_start
+            if r.status_code not in (200, 201):
+                # TODO custom exception maybe?
+                raise RuntimeError(f"HTTP request failed with status code {r.status_code}")
+
+            # the server can advertise the image types it supports with the Accept-Post header
+            if 'accept-post' in r.headers:
+                self.accepted_image_types = {t.split(';')[0].strip().lower()
+                                             for t in r.headers['accept-post'].split(',')}
+            self._report_upload(len(data.image_data), elapsed_secs)
+
+    async def send_timelapse(self, data: TimelapseData):
+        if not self.timelapse_url:
+            # clips are not wanted by this server
+            _LOGGER.debug("timelapse_url not configured, not sending time-lapse clip")
+            return
+
+        _LOGGER.debug(f"Sending time-lapse clip @ {data.start} - {data.end}")
+        async with self._httpclient() as client:
+            auth = BearerTokenAuth(self.api_token)
+            timelapse_url = URL(self.timelapse_url).copy_merge_params({
+                'start': data.start.isoformat(),
+                'end': data.end.isoformat(),
+                'frames': data.frames,
+            })
+            r = await client.post(timelapse_url, content=data.video_data, auth=auth, headers={
+                'content-type': data.video_type,
+            })
             if r.status_code not in (200, 201):
                 # TODO custom exception maybe?
                 raise RuntimeError(f"HTTP request failed with status code {r.status_code}")
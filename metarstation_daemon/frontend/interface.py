@@ -1,17 +1,33 @@
-from ..data import SensorData, WebcamData
+from typing import Callable
+
+from ..data import SensorData, WebcamData, TimelapseData
 
 
 class DataFrontend:
 
+    accepted_image_types: set[str] | None = None
+    """Image types the server advertised support for (None if unknown)."""
+
     # noinspection PyUnusedLocal
     def __init__(self, config: dict):
-        pass
+        self.upload_listener: Callable[[int, float], None] | None = None
+        """Called with (size, elapsed_secs) after a webcam snapshot has been transferred."""
 
     async def setup(self):
         raise NotImplementedError()
 
+    async def close(self):
+        pass
+
     async def send_data(self, data: list[SensorData]):
         raise NotImplementedError()
 
     async def send_webcam(self, data: WebcamData):
         raise NotImplementedError()
+
+    async def send_timelapse(self, data: TimelapseData):
+        raise NotImplementedError()
+
+    def _report_upload(self, size: int, elapsed_secs: float):
+        if self.upload_listener:
+            self.upload_listener(size, elapsed_secs)
@@ -0,0 +1,270 @@
+"""
+Frontend serving the latest data over HTTP on the local network, for displays at the airfield.
+
+GET /latest.json     latest sensor reading
+GET /products.json   aggregated products over a time window (wind averages, gusts, pressure tendency, ...)
+GET /webcam          latest webcam snapshot
+GET /timelapse       latest time-lapse clip
+GET /events          Server-Sent Events stream, pushing every update ("data", "products", "webcam" and "timelapse"
+                     events)
+
+Responses are serialized once per update and served from memory: clients should use If-None-Match to
+get a 304 when nothing changed.
+"""
+import asyncio
+import collections
+import datetime
+import email.utils
+import hashlib
+import json
+import logging
+import math
+
+from .interface import DataFrontend
+from ..data import SensorData, WebcamData, TimelapseData
+
+_LOGGER = logging.getLogger(__name__)
+
+_READ_TIMEOUT_SECS = 30
+_MAX_HEADERS = 50
+_SSE_QUEUE_LIMIT = 16
+_SSE_KEEPALIVE_SECS = 30
+
+_STATUS_REASONS = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+}
+
+
+def _response_head(status: int, headers: dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_STATUS_REASONS[status]}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+_NOT_FOUND = _response_head(404, {'Content-Length': '0'})
+# the request body (if any) is not read, so the connection can't be reused
+_METHOD_NOT_ALLOWED = _response_head(405, {'Content-Length': '0', 'Allow': 'GET, HEAD', 'Connection': 'close'})
+_BAD_REQUEST = _response_head(400, {'Content-Length': '0', 'Connection': 'close'})
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match comparison: a list of (possibly weak) entity tags, or "*"."""
+    if not if_none_match:
+        return False
+    return any(tag == '*' or tag.removeprefix('W/') == etag
+               for tag in (t.strip() for t in if_none_match.split(',')))
+
+
+class _Resource:
+    """A pre-serialized response, with all of its variants ready to be written to clients."""
+
+    def __init__(self, body: bytes, content_type: str, last_modified: datetime.datetime):
+        self.etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        headers = {
+            'Content-Type': content_type,
+            'ETag': self.etag,
+            'Last-Modified': email.utils.format_datetime(last_modified.astimezone(datetime.UTC), usegmt=True),
+            'Cache-Control': 'no-cache',
+            'Access-Control-Allow-Origin': '*',
+        }
+        self.body = body
+        self.head = _response_head(200, headers | {'Content-Length': str(len(body))})
+        self.full = self.head + body
+        self.not_modified = _response_head(304, headers)
+
+
+def _encode_json(data) -> bytes:
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def _sse_event(event: str, data: bytes) -> bytes:
+    return b'event: ' + event.encode() + b'\ndata: ' + data + b'\n\n'
+
+
+def _aggregate(readings: list[SensorData]) -> dict:
+    """Aggregated products over the given readings (oldest first)."""
+    latest = readings[-1]
+    products = {
+        'from': readings[0].timestamp.isoformat(),
+        'to': latest.timestamp.isoformat(),
+        'count': len(readings),
+        'temperature': latest.temperature,
+        'dew_point': latest.dew_point,
+        'humidity': latest.humidity,
+        'pressure': latest.pressure,
+        'pressure_tendency': None,
+        'wind_speed_avg': None,
+        'wind_speed_min': None,
+        'gust_speed_max': None,
+        'wind_direction_avg': None,
+        'wind_direction_from': None,
+        'wind_direction_to': None,
+    }
+
+    pressures = [r.pressure for r in readings if r.pressure is not None]
+    if len(pressures) > 1:
+        products['pressure_tendency'] = round(pressures[-1] - pressures[0], 1)
+
+    speeds = [r.wind_speed for r in readings if r.wind_speed is not None]
+    if speeds:
+        products['wind_speed_avg'] = round(sum(speeds) / len(speeds), 1)
+        products['wind_speed_min'] = min(speeds)
+    gusts = [r.gust_speed for r in readings if r.gust_speed is not None]
+    if gusts:
+        products['gust_speed_max'] = max(gusts)
+
+    directions = [r.wind_direction for r in readings if r.wind_direction is not None]
+    if directions:
+        # circular mean, then the range of directions as deviations from the mean
+        mean = math.degrees(math.atan2(sum(math.sin(math.radians(d)) for d in directions),
+                                       sum(math.cos(math.radians(d)) for d in directions))) % 360
+        deviations = [(d - mean + 180) % 360 - 180 for d in directions]
+        products['wind_direction_avg'] = round(mean) % 360
+        products['wind_direction_from'] = round(mean + min(deviations)) % 360
+        products['wind_direction_to'] = round(mean + max(deviations)) % 360
+
+    return products
+
+
+class LocalDataFrontend(DataFrontend):
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.listen_address: str = config.get('listen_address', '0.0.0.0')
+        self.port: int = config.get('port', 8080)
+        self.products_window_secs: int = config.get('products_window_secs', 600)
+        self._readings: collections.deque[SensorData] = collections.deque()
+        self._resources: dict[str, _Resource] = {}
+        self._sse_clients: set[asyncio.Queue[bytes | None]] = set()
+        self._server: asyncio.Server | None = None
+
+    async def setup(self):
+        _LOGGER.debug(f"Local data frontend listening on {self.listen_address}:{self.port}")
+        self._server = await asyncio.start_server(self._handle_connection, self.listen_address, self.port)
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            self._server = None
+        # terminate event streams
+        for queue in self._sse_clients:
+            while queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def send_data(self, data: list[SensorData]):
+        for reading in data:
+            if not self._readings or reading.timestamp > self._readings[-1].timestamp:
+                self._readings.append(reading)
+        latest = self._readings[-1]
+        window_start = latest.timestamp - datetime.timedelta(seconds=self.products_window_secs)
+        while self._readings[0].timestamp < window_start:
+            self._readings.popleft()
+
+        latest_json = latest.to_json_bytes()
+        products_json = _encode_json(_aggregate(list(self._readings)))
+        self._resources['/latest.json'] = _Resource(latest_json, 'application/json', latest.timestamp)
+        self._resources['/products.json'] = _Resource(products_json, 'application/json', latest.timestamp)
+        self._publish(_sse_event('data', latest_json) + _sse_event('products', products_json))
+
+    async def send_webcam(self, data: WebcamData):
+        self._resources['/webcam'] = _Resource(data.image_data, data.image_type, data.timestamp)
+        self._publish(_sse_event('webcam', _encode_json({
+            'timestamp': data.timestamp.isoformat(),
+            'image_type': data.image_type,
+        })))
+
+    async def send_timelapse(self, data: TimelapseData):
+        self._resources['/timelapse'] = _Resource(data.video_data, data.video_type, data.end)
+        self._publish(_sse_event('timelapse', _encode_json({
+            'start': data.start.isoformat(),
+            'end': data.end.isoformat(),
+            'frames': data.frames,
+            'video_type': data.video_type,
+        })))
+
+    def _publish(self, event: bytes):
+        for queue in self._sse_clients:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # slow client, it will miss this update
+                pass
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), _READ_TIMEOUT_SECS)
+                if not request_line:
+                    break
+
+                headers = {}
+                for _ in range(_MAX_HEADERS):
+                    line = await asyncio.wait_for(reader.readline(), _READ_TIMEOUT_SECS)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    writer.write(_BAD_REQUEST)
+                    break
+
+                path = target.split('?', 1)[0]
+                if method not in ('GET', 'HEAD'):
+                    writer.write(_METHOD_NOT_ALLOWED)
+                    await writer.drain()
+                    break
+                elif path == '/events' and method == 'GET':
+                    await self._stream_events(writer)
+                    break
+                elif resource := self._resources.get(path):
+                    if _etag_matches(headers.get('if-none-match'), resource.etag):
+                        writer.write(resource.not_modified)
+                    elif method == 'HEAD':
+                        writer.write(resource.head)
+                    else:
+                        writer.write(resource.full)
+                else:
+                    writer.write(_NOT_FOUND)
+                await writer.drain()
+
+                if version == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+                    break
+
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream_events(self, writer: asyncio.StreamWriter):
+        writer.write(_response_head(200, {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'Access-Control-Allow-Origin': '*',
+        }))
+        # start with the current state
+        for path, event in (('/latest.json', 'data'), ('/products.json', 'products')):
+            if resource := self._resources.get(path):
+                writer.write(_sse_event(event, resource.body))
+
+        queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=_SSE_QUEUE_LIMIT)
+        self._sse_clients.add(queue)
+        try:
+            while True:
+                await writer.drain()
+                try:
+                    event = await asyncio.wait_for(queue.get(), _SSE_KEEPALIVE_SECS)
+                except asyncio.TimeoutError:
+                    event = b': keepalive\n\n'
+                if event is None:
+                    break
+                writer.write(event)
+        finally:
+            self._sse_clients.discard(queue)
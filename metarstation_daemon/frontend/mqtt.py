@@ -0,0 +1,200 @@
+import asyncio
+import collections
+import json
+import logging
+import struct
+from dataclasses import dataclass
+
+import aiomqtt
+
+from .interface import DataFrontend
+from ..data import SensorData, WebcamData, TimelapseData
+
+_LOGGER = logging.getLogger(__name__)
+
+_BINARY_FORMAT = struct.Struct('<dHbfffffffHBBf')
+_BINARY_FIELDS = ('battery', 'temperature', 'humidity', 'dew_point', 'pressure', 'illumination',
+                  'wind_speed', 'gust_speed', 'wind_direction', 'uv_index', 'raining', 'precipitation')
+
+
+def pack_reading(data: SensorData) -> bytes:
+    """
+    Compact binary representation of a reading (47 bytes, little-endian):
+    timestamp (double, UNIX epoch), presence bitmask (uint16, bit N set if field N is not None),
+    then the fields in _BINARY_FIELDS order: battery (int8), temperature, humidity, dew_point, pressure, illumination,
+    wind_speed, gust_speed (float), wind_direction (uint16), uv_index (uint8), raining (uint8), precipitation (float).
+    Missing values are encoded as zero.
+    """
+    mask = 0
+    values = []
+    for index, name in enumerate(_BINARY_FIELDS):
+        value = getattr(data, name)
+        if value is not None:
+            mask |= 1 << index
+        values.append(value or 0)
+    return _BINARY_FORMAT.pack(data.timestamp.timestamp(), mask, *values)
+
+
+@dataclass(kw_only=True)
+class _Message:
+    topic: str
+    payload: bytes
+    retain: bool = False
+
+
+class MqttDataFrontend(DataFrontend):
+    """
+    Publishes data to a MQTT broker over a single persistent connection.
+
+    Readings are published on <prefix>/readings (JSON) and optionally <prefix>/readings/binary (see pack_reading);
+    the latest reading is also retained on <prefix>/latest. Webcam snapshots are retained on <prefix>/webcam, with
+    their metadata on <prefix>/webcam/meta; time-lapse clips likewise on <prefix>/timelapse and <prefix>/timelapse/meta.
+
+    Messages are buffered while the broker is unreachable and published with a window of in-flight messages
+    waiting for acknowledgement. Messages not acknowledged when the connection drops are published again.
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.host: str = config['host']
+        self.port: int = config.get('port', 1883)
+        self.username: str | None = config.get('username', None)
+        self.password: str | None = config.get('password', None)
+        self.client_id: str = config.get('client_id', 'metarstation-daemon')
+        self.topic_prefix: str = config.get('topic_prefix', 'metarstation')
+        self.qos: int = config.get('qos', 1)
+        self.max_inflight: int = config.get('max_inflight', 20)
+        self.binary_payload: bool = config.get('binary_payload', False)
+        self.buffer_limit: int = config.get('buffer_limit', 1000)
+        self.keepalive_secs: int = config.get('keepalive_secs', 60)
+        self.reconnect_max_secs: float = config.get('reconnect_max_secs', 120)
+        self._buffer: collections.deque[_Message] = collections.deque()
+        # retained topics only need their latest message
+        self._retained: dict[str, _Message] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.dropped = 0
+
+    async def setup(self):
+        _LOGGER.debug(f"MQTT data frontend starting ({self.host}:{self.port})")
+        self._task = asyncio.get_running_loop().create_task(self._run(), name='mqtt-publish')
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+
+    async def send_data(self, data: list[SensorData]):
+        for reading in data:
+            self._enqueue(_Message(topic=f"{self.topic_prefix}/readings", payload=reading.to_json_bytes()))
+            if self.binary_payload:
+                self._enqueue(_Message(topic=f"{self.topic_prefix}/readings/binary", payload=pack_reading(reading)))
+        if data:
+            self._enqueue(_Message(topic=f"{self.topic_prefix}/latest", payload=data[-1].to_json_bytes(),
+                                   retain=True))
+
+    async def send_webcam(self, data: WebcamData):
+        meta = json.dumps({'timestamp': data.timestamp.isoformat(), 'image_type': data.image_type})
+        self._enqueue(_Message(topic=f"{self.topic_prefix}/webcam", payload=data.image_data, retain=True))
+        self._enqueue(_Message(topic=f"{self.topic_prefix}/webcam/meta", payload=meta.encode(), retain=True))
+
+    async def send_timelapse(self, data: TimelapseData):
+        meta = json.dumps({'start': data.start.isoformat(), 'end': data.end.isoformat(),
+                           'frames': data.frames, 'video_type': data.video_type})
+        self._enqueue(_Message(topic=f"{self.topic_prefix}/timelapse", payload=data.video_data, retain=True))
+        self._enqueue(_Message(topic=f"{self.topic_prefix}/timelapse/meta", payload=meta.encode(), retain=True))
+
+    def _enqueue(self, message: _Message):
+        if message.retain:
+            self._retained.pop(message.topic, None)
+            self._retained[message.topic] = message
+        else:
+            self._buffer.append(message)
+            while len(self._buffer) > self.buffer_limit:
+                self._buffer.popleft()
+                self.dropped += 1
+        self._wakeup.set()
+
+    def _requeue(self, message: _Message):
+        if message.retain:
+            # don't overwrite a newer message
+            self._retained.setdefault(message.topic, message)
+        elif len(self._buffer) < self.buffer_limit:
+            self._buffer.appendleft(message)
+        else:
+            self.dropped += 1
+
+    def _next_message(self) -> _Message | None:
+        if self._buffer:
+            return self._buffer.popleft()
+        if self._retained:
+            return self._retained.pop(next(iter(self._retained)))
+        return None
+
+    async def _run(self):
+        reconnect_secs = 1
+        while True:
+            try:
+                async with aiomqtt.Client(
+                    self.host,
+                    self.port,
+                    username=self.username,
+                    password=self.password,
+                    identifier=self.client_id,
+                    # persistent session: the broker keeps our state across reconnections
+                    clean_session=False,
+                    keepalive=self.keepalive_secs,
+                    max_inflight_messages=self.max_inflight,
+                ) as client:
+                    # all publish calls in the window are expected to be pending at the same time
+                    client.pending_calls_threshold = self.max_inflight
+                    _LOGGER.info(f"Connected to MQTT broker {self.host}:{self.port}")
+                    reconnect_secs = 1
+                    await self._publish_messages(client)
+
+            except* aiomqtt.MqttError as e:
+                _LOGGER.warning(f"MQTT connection error, reconnecting in {reconnect_secs}s: {e.exceptions[0]}")
+            await asyncio.sleep(reconnect_secs)
+            reconnect_secs = min(reconnect_secs * 2, self.reconnect_max_secs)
+
+    async def _publish_messages(self, client: aiomqtt.Client):
+        window = asyncio.Semaphore(self.max_inflight)
+        # messages not acknowledged yet, in publishing order
+        inflight: dict[asyncio.Task, _Message] = {}
+
+        def published(task: asyncio.Task):
+            if _acknowledged(task):
+                del inflight[task]
+
+        # publish whatever was buffered while offline
+        self._wakeup.set()
+        try:
+            # a failed publish cancels all the others and the loop itself
+            async with asyncio.TaskGroup() as group:
+                while True:
+                    await self._wakeup.wait()
+                    self._wakeup.clear()
+
+                    while True:
+                        await window.acquire()
+                        message = self._next_message()
+                        if not message:
+                            window.release()
+                            break
+                        task = group.create_task(self._publish(client, message, window))
+                        inflight[task] = message
+                        task.add_done_callback(published)
+        finally:
+            # this includes the tasks cancelled before they even started
+            for task, message in reversed(inflight.items()):
+                if not _acknowledged(task):
+                    self._requeue(message)
+
+    async def _publish(self, client: aiomqtt.Client, message: _Message, window: asyncio.Semaphore):
+        try:
+            await client.publish(message.topic, message.payload, qos=self.qos, retain=message.retain)
+        finally:
+            window.release()
+
+
+def _acknowledged(task: asyncio.Task) -> bool:
+    return task.done() and not task.cancelled() and task.exception() is None
@@ -0,0 +1,297 @@
+"""
+Local history of sensor readings, as round-robin time series at multiple resolutions.
+
+Each resolution is a fixed-size memory-mapped file with one slot per time bucket: the slot of a bucket is its index
+modulo the number of slots, so older data is overwritten in place and disk usage never changes. Files are laid out
+by column (all timestamps, then all counts, then the values of each field), so a range query is a couple of slices
+for each column, without any search. Buckets skipped (no readings, daemon not running) are cleared when writing the
+next one, so all slots hold the latest buckets, except those never written yet.
+
+Readings are downsampled incrementally: every reading updates the running aggregates of the current bucket of each
+resolution, which are written to their slot right away.
+"""
+import array
+import bisect
+import datetime
+import logging
+import math
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+
+from .data import SensorData
+
+_LOGGER = logging.getLogger(__name__)
+
+_FILE_MAGIC = b'MSHIST'
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct('<6sBxIII')
+"""Magic, version, bucket size in seconds, number of slots, checksum of the columns layout."""
+_HEADER_SIZE = 64
+
+FIELDS = ('temperature', 'humidity', 'dew_point', 'pressure', 'illumination',
+          'wind_speed', 'gust_speed', 'wind_direction', 'uv_index', 'precipitation')
+"""Fields of SensorData kept in the history."""
+
+_COLUMNS = (('timestamp', 'd'), ('count', 'I'), *((name, 'f') for name in FIELDS))
+"""Columns of the history files: bucket start (UNIX timestamp), number of readings, then the fields."""
+
+_MAX_FIELDS = ('gust_speed',)
+"""Fields aggregated with the maximum rather than the mean."""
+
+_DIRECTION_FIELDS = ('wind_direction',)
+"""Fields aggregated with the circular mean."""
+
+RESOLUTIONS = {
+    'raw': (10, 1),
+    '1min': (60, 7),
+    '10min': (600, 90),
+    '1h': (3600, 1825),
+}
+"""Default resolutions: bucket size in seconds and retention in days. Readings closer than the raw bucket size
+(scans are at least 10 seconds apart) overwrite each other."""
+
+
+class _RoundRobinFile:
+
+    def __init__(self, path: Path, step_secs: int, slots: int):
+        self.path = path
+        self.step_secs = step_secs
+        self.slots = slots
+        self.columns: dict[str, memoryview] = {}
+        self.last_bucket: int | None = None
+        """Latest bucket written."""
+        self._file = None
+        self._mmap: mmap.mmap | None = None
+
+    def open(self):
+        layout = ','.join(f'{name}:{typecode}' for name, typecode in _COLUMNS).encode()
+        header = _FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, self.step_secs, self.slots, zlib.crc32(layout))
+        size = _HEADER_SIZE + sum(array.array(typecode).itemsize * self.slots for _, typecode in _COLUMNS)
+
+        self._file = open(self.path, 'r+b' if self.path.exists() else 'w+b')
+        if self._file.read(_FILE_HEADER.size) != header or os.fstat(self._file.fileno()).st_size != size:
+            if os.fstat(self._file.fileno()).st_size > 0:
+                _LOGGER.warning(f"History file {self.path} has a different layout, starting over")
+            self._file.truncate(0)
+            if hasattr(os, 'posix_fallocate'):
+                # allocate all the space now: writing to a sparse mapping with a full disk would crash
+                os.posix_fallocate(self._file.fileno(), 0, size)
+            else:
+                # e.g. macOS
+                self._file.truncate(size)
+            self._file.seek(0)
+            self._file.write(header)
+            self._file.flush()
+
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        offset = _HEADER_SIZE
+        for name, typecode in _COLUMNS:
+            length = array.array(typecode).itemsize * self.slots
+            self.columns[name] = memoryview(self._mmap)[offset:offset + length].cast(typecode)
+            offset += length
+
+        latest = max(self.columns['timestamp'])
+        self.last_bucket = int(latest // self.step_secs) if latest > 0 else None
+
+    def close(self):
+        self.last_bucket = None
+        for column in self.columns.values():
+            column.release()
+        self.columns.clear()
+        if self._mmap:
+            self._mmap.flush()
+            self._mmap.close()
+            self._mmap = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def write(self, bucket: int, count: int, values: dict[str, float]):
+        if self.last_bucket is not None and bucket > self.last_bucket + 1:
+            # slots of the skipped buckets still hold older data
+            self._clear(max(self.last_bucket + 1, bucket - self.slots), bucket - 1)
+        if self.last_bucket is None or bucket > self.last_bucket:
+            self.last_bucket = bucket
+
+        index = bucket % self.slots
+        self.columns['timestamp'][index] = bucket * self.step_secs
+        self.columns['count'][index] = count
+        for name in FIELDS:
+            self.columns[name][index] = values.get(name, math.nan)
+
+    def read_slot(self, bucket: int) -> tuple[int, dict[str, float]] | None:
+        """Count and values stored for a bucket, None if the slot holds another bucket."""
+        index = bucket % self.slots
+        if self.columns['timestamp'][index] != bucket * self.step_secs:
+            return None
+        return self.columns['count'][index], {name: self.columns[name][index] for name in FIELDS}
+
+    def read(self, first_bucket: int, last_bucket: int) -> dict[str, array.array]:
+        # only the latest buckets are still there
+        first_bucket = max(first_bucket, last_bucket - self.slots + 1)
+        result = {name: array.array(typecode) for name, typecode in _COLUMNS}
+        if last_bucket < first_bucket:
+            return result
+
+        # buckets with data: up to the latest one written, from the first one written (the slots of older buckets
+        # have never been written, and those after that have been written at least once)
+        last_valid = min(last_bucket, self.last_bucket) if self.last_bucket is not None else first_bucket - 1
+        first_valid = bisect.bisect_left(range(first_bucket, last_valid + 1), True,
+                                         key=lambda b: self.columns['timestamp'][b % self.slots] == b * self.step_secs)
+        first_valid += first_bucket
+
+        self._append_empty(result, first_bucket, min(first_valid, last_bucket + 1))
+        if first_valid <= last_valid:
+            first, last = first_valid % self.slots, last_valid % self.slots
+            ranges = [(first, last + 1)] if first <= last else [(first, self.slots), (0, last + 1)]
+            for name, _ in _COLUMNS:
+                for start, end in ranges:
+                    result[name].frombytes(self.columns[name][start:end].cast('B'))
+        self._append_empty(result, max(last_valid + 1, first_valid), last_bucket + 1)
+        return result
+
+    def _clear(self, first_bucket: int, last_bucket: int):
+        """Mark buckets as having no readings."""
+        empty = {name: array.array(typecode) for name, typecode in _COLUMNS}
+        self._append_empty(empty, first_bucket, last_bucket + 1)
+        first, last = first_bucket % self.slots, last_bucket % self.slots
+        ranges = [(first, last + 1)] if first <= last else [(first, self.slots), (0, last + 1)]
+        offset = 0
+        for start, end in ranges:
+            for name, _ in _COLUMNS:
+                self.columns[name][start:end] = empty[name][offset:offset + end - start]
+            offset += end - start
+
+    def _append_empty(self, columns: dict[str, array.array], first_bucket: int, end_bucket: int):
+        """Append rows without readings for buckets from first_bucket to end_bucket (excluded)."""
+        length = end_bucket - first_bucket
+        if length <= 0:
+            return
+        columns['timestamp'].extend(array.array('d', range(first_bucket * self.step_secs,
+                                                           end_bucket * self.step_secs, self.step_secs)))
+        columns['count'].extend(array.array('I', bytes(columns['count'].itemsize * length)))
+        for name in FIELDS:
+            columns[name].extend(array.array('f', [math.nan]) * length)
+
+
+class _Aggregate:
+    """Running aggregates of the readings in a bucket."""
+
+    def __init__(self, bucket: int):
+        self.bucket = bucket
+        self.count = 0
+        self._sums: dict[str, float] = {}
+        self._counts: dict[str, int] = {}
+        self._max: dict[str, float] = {}
+
+    def resume(self, count: int, values: dict[str, float]):
+        """Start from previously stored aggregates (mean values are weighted with the bucket count)."""
+        self.count = count
+        for name, value in values.items():
+            if not math.isnan(value):
+                self._add_value(name, value, count)
+
+    def add(self, data: SensorData):
+        self.count += 1
+        for name in FIELDS:
+            value = getattr(data, name)
+            if value is not None:
+                self._add_value(name, value, 1)
+
+    def values(self) -> dict[str, float]:
+        values = {name: self._sums[name] / self._counts[name] for name in self._sums}
+        for name in _DIRECTION_FIELDS:
+            if f'{name}_sin' in values:
+                direction = math.degrees(math.atan2(values.pop(f'{name}_sin'), values.pop(f'{name}_cos')))
+                values[name] = round(direction, 1) % 360
+        values.update(self._max)
+        return values
+
+    def _add_value(self, name: str, value: float, weight: int):
+        if name in _MAX_FIELDS:
+            self._max[name] = max(self._max.get(name, value), value)
+        elif name in _DIRECTION_FIELDS:
+            self._add_mean(f'{name}_sin', math.sin(math.radians(value)), weight)
+            self._add_mean(f'{name}_cos', math.cos(math.radians(value)), weight)
+        else:
+            self._add_mean(name, value, weight)
+
+    def _add_mean(self, name: str, value: float, weight: int):
+        self._sums[name] = self._sums.get(name, 0.0) + value * weight
+        self._counts[name] = self._counts.get(name, 0) + weight
+
+
+class _Series:
+
+    def __init__(self, name: str, file: _RoundRobinFile):
+        self.name = name
+        self.file = file
+        self._aggregate: _Aggregate | None = None
+
+    def add(self, data: SensorData):
+        bucket = int(data.timestamp.timestamp() // self.file.step_secs)
+        if self._aggregate is None or bucket > self._aggregate.bucket:
+            self._aggregate = _Aggregate(bucket)
+            # continue a bucket written before a restart
+            if stored := self.file.read_slot(bucket):
+                self._aggregate.resume(*stored)
+        elif bucket < self._aggregate.bucket:
+            _LOGGER.debug(f"Reading older than the current {self.name} bucket, not kept in history")
+            return
+
+        self._aggregate.add(data)
+        self.file.write(bucket, self._aggregate.count, self._aggregate.values())
+
+
+class HistoryStore:
+
+    def __init__(self, config: dict):
+        self.path = Path(config['path'])
+        retention_days: dict[str, float] = config.get('retention_days', {})
+        self._series = []
+        for name, (step_secs, days) in RESOLUTIONS.items():
+            slots = int(retention_days.get(name, days) * 86400 // step_secs)
+            if slots < 1:
+                raise ValueError(f'History retention of {name} must be at least {step_secs} seconds')
+            self._series.append(_Series(name, _RoundRobinFile(self.path / f'{name}.rrd', step_secs, slots)))
+
+    def open(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        for series in self._series:
+            series.file.open()
+        _LOGGER.info(f"History store opened ({self.path})")
+
+    def close(self):
+        for series in self._series:
+            series.file.close()
+
+    def add(self, data: SensorData):
+        """Add a reading to all resolutions."""
+        for series in self._series:
+            series.add(data)
+
+    def query(self, start: datetime.datetime, end: datetime.datetime,
+              resolution: str | None = None) -> tuple[str, dict[str, array.array]]:
+        """
+        History between start and end (inclusive), one column per field, plus 'timestamp' (bucket start, UNIX
+        timestamp) and 'count' (number of readings). Missing values are NaN.
+        :param resolution: one of RESOLUTIONS, or None for the finest resolution still covering start
+        :return: the resolution and the columns
+        """
+        if resolution is None:
+            age = datetime.datetime.now(datetime.UTC).timestamp() - start.timestamp()
+            series = next((s for s in self._series if s.file.slots * s.file.step_secs >= age), self._series[-1])
+        else:
+            series = next((s for s in self._series if s.name == resolution), None)
+            if series is None:
+                raise ValueError(f'Unknown history resolution: {resolution}')
+
+        step = series.file.step_secs
+        return series.name, series.file.read(int(start.timestamp() // step), int(end.timestamp() // step))
+
+    def status(self) -> dict:
+        return {series.name: {'step_secs': series.file.step_secs, 'slots': series.file.slots}
+                for series in self._series}
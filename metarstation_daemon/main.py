@@ -13,8 +13,14 @@ from .backend.interface import SensorBackend, SensorBackendQueue, WebcamBackend,
 from .backend.tapocam import TapoWebcamBackend
 from .backend.ws90 import WS90SensorBackend
 from .data import SensorData, WebcamData
-from .frontend.http import HTTPDataFrontend
+from .diagnostics import Diagnostics
+from .frontend import create_frontend
+from .frontend.fanout import FanoutDataFrontend
 from .frontend.interface import DataFrontend
+from .history import HistoryStore
+from .qc import QualityControl
+from .supervisor import Supervisor
+from .timelapse import TimelapseBuilder
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -34,105 +40,321 @@ class WeatherDaemon:
         args_parser.add_argument('-c', '--config', required=True, help='path to configuration file')
         parsed_args = args_parser.parse_args(args[1:])
 
-        config_file = parsed_args.config
-        config_file_fp: BufferedReader | BinaryIO | IO[bytes]
-        with open(config_file, 'rb') as config_file_fp:
-            self.config = tomllib.load(config_file_fp)
+        self._config_file = parsed_args.config
+        self.config = self._load_config()
+
+        # wakes up the data collection loop when sensor or webcam data is available
+        self._data_wakeup = asyncio.Event()
 
         # sensor backend
         self._data_queue = asyncio.Queue(maxsize=DATA_QUEUE_LIMIT)
-        self._backend: SensorBackend = WS90SensorBackend(self.config['backend'], SensorBackendQueue(self._data_queue))
+        self._backend: SensorBackend = self._create_sensor_backend(self.config['backend'],
+                                                                   SensorBackendQueue(self._data_queue,
+                                                                                      self._data_wakeup))
 
-        # webcam backend
+        # webcam backend (the callback is always needed by the collection loop)
         self._webcam: WebcamBackend | None = None
-        self._webcam_callback: WebcamBackendCallback | None = None
+        self._webcam_callback = WebcamBackendCallback(self._data_wakeup)
         if 'webcam' in self.config:
-            self._webcam_callback = WebcamBackendCallback()
-            self._webcam: WebcamBackend | None = TapoWebcamBackend(self.config['webcam'], self._webcam_callback)
+            self._webcam: WebcamBackend | None = self._create_webcam_backend(self.config['webcam'],
+                                                                             self._webcam_callback)
 
         # data upload frontend
-        self._frontend: DataFrontend = HTTPDataFrontend(self.config['frontend'])
+        self._frontend: DataFrontend = self._create_frontend(self.config['frontend'])
+        self._frontend.upload_listener = self._webcam_uploaded
+
+        # sensor data quality control
+        self._qc: QualityControl | None = None
+        if 'qc' in self.config:
+            self._qc = QualityControl(self.config['qc'])
+
+        # local history of sensor data
+        self._history: HistoryStore | None = None
+        if 'history' in self.config:
+            self._history = HistoryStore(self.config['history'])
+
+        # time-lapse clips built from webcam snapshots
+        self._timelapse: TimelapseBuilder | None = None
+        if self._webcam and 'timelapse' in self.config:
+            self._timelapse = self._create_timelapse(self.config['timelapse'])
+
+        # on-demand diagnostics
+        self._diagnostics = Diagnostics(self.config.get('diagnostics', {}))
+
+        self._supervisor = Supervisor()
+        self._register_status_sources()
 
         self._shutdown_event = asyncio.Event()
+        self._reload_event = asyncio.Event()
         self._failed_data: deque[SensorData] = deque(maxlen=FAILED_QUEUE_LIMIT)
 
+    def _load_config(self) -> dict:
+        config_file_fp: BufferedReader | BinaryIO | IO[bytes]
+        with open(self._config_file, 'rb') as config_file_fp:
+            return tomllib.load(config_file_fp)
+
+    # noinspection PyMethodMayBeStatic
+    def _create_sensor_backend(self, config: dict, queue: SensorBackendQueue) -> SensorBackend:
+        backend_type = config.get('type', 'ws90')
+        if backend_type == 'ws90':
+            return WS90SensorBackend(config, queue)
+        elif backend_type == 'replay':
+            from .backend.replay import ReplaySensorBackend
+            return ReplaySensorBackend(config, queue)
+        else:
+            raise ValueError(f'Unknown sensor backend type: {backend_type}')
+
+    # noinspection PyMethodMayBeStatic
+    def _create_webcam_backend(self, config: dict, callback: WebcamBackendCallback) -> WebcamBackend:
+        webcam_type = config.get('type', 'tapo')
+        if webcam_type == 'tapo':
+            return TapoWebcamBackend(config, callback)
+        elif webcam_type == 'replay':
+            from .backend.replay import ReplayWebcamBackend
+            return ReplayWebcamBackend(config, callback)
+        else:
+            raise ValueError(f'Unknown webcam backend type: {webcam_type}')
+
+    # noinspection PyMethodMayBeStatic
+    def _create_frontend(self, config: dict) -> DataFrontend:
+        return create_frontend(config)
+
+    def _webcam_uploaded(self, size: int, elapsed_secs: float):
+        # the webcam might have been replaced by a configuration reload in the meantime
+        if self._webcam and self._webcam.encoding_policy:
+            # the frontend knows the accepted image types once it has uploaded something
+            self._webcam.encoding_policy.record_upload(size, elapsed_secs, self._frontend.accepted_image_types)
+
+    def _create_timelapse(self, config: dict) -> TimelapseBuilder:
+        # the frontend might be replaced by a configuration reload
+        return TimelapseBuilder(config, lambda clip: self._frontend.send_timelapse(clip))
+
+    def _register_status_sources(self):
+        self._diagnostics.clear_status_sources()
+        self._diagnostics.add_status_source('supervisor', self._supervisor.status)
+        if isinstance(self._frontend, FanoutDataFrontend):
+            self._diagnostics.add_status_source('frontend', self._frontend.status)
+        if self._qc:
+            self._diagnostics.add_status_source('qc', self._qc.counters)
+        if isinstance(self._backend, WS90SensorBackend) and self._backend.scan_scheduler:
+            self._diagnostics.add_status_source('scan_scheduler', self._backend.scan_scheduler.status)
+        if self._webcam and self._webcam.encoding_policy:
+            self._diagnostics.add_status_source('encoding', self._webcam.encoding_policy.status)
+        if self._timelapse:
+            self._diagnostics.add_status_source('timelapse', self._timelapse.status)
+        if self._history:
+            self._diagnostics.add_status_source('history', self._history.status)
+
+    def shutdown(self):
+        self._shutdown_event.set()
+
+    def reload(self):
+        """Reload the configuration file, restarting the components whose configuration changed."""
+        self._reload_event.set()
+
     async def run(self):
         def sig_handler(code):
             _LOGGER.info("Received signal %s", code)
-            self._shutdown_event.set()
+            self.shutdown()
 
         for sig in (signal.SIGINT, signal.SIGTERM):
             asyncio.get_running_loop().add_signal_handler(sig, functools.partial(sig_handler, sig))
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.reload)
 
-        # start collecting data from the device
-        await self._backend.start()
+        # diagnostics: SIGUSR1 toggles a profiling session, SIGUSR2 dumps running tasks
+        # (through lambdas, diagnostics might be replaced by a configuration reload)
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, lambda: self._diagnostics.toggle_session())
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, lambda: self._diagnostics.dump_tasks())
 
-        # start collecting images from the webcam
-        if self._webcam:
-            await self._webcam.start()
+        async with self._supervisor:
+            if self._history:
+                self._history.open()
 
-        # setup the data collection frontend
-        await self._frontend.setup()
+            # start collecting data from the device
+            await self._backend.start()
 
-        # start collecting data
-        data_collect_task = asyncio.get_running_loop().create_task(self._collect_data_start())
+            # start collecting images from the webcam
+            if self._webcam:
+                await self._webcam.start()
 
-        await self._shutdown_event.wait()
+            # setup the data collection frontend
+            await self._frontend.setup()
 
-        # cleanup
-        data_collect_task.cancel()
-        await self._backend.stop()
-        if self._webcam:
-            await self._webcam.stop()
+            if self._timelapse:
+                self._timelapse.start()
+
+            # start collecting data
+            self._supervisor.spawn('collect-data', self._collect_data_start)
+            self._supervisor.spawn('reload-config', self._reload_config_start)
+
+            await self._shutdown_event.wait()
+
+            # cleanup
+            self._diagnostics.stop_session()
+            await self._backend.stop()
+            if self._webcam:
+                await self._webcam.stop()
+            if self._timelapse:
+                await self._timelapse.stop()
+            await self._frontend.close()
+            if self._history:
+                self._history.close()
+            self._supervisor.cancel_all()
 
     async def _collect_data_start(self):
         _LOGGER.debug("Starting data collection")
 
-        while not self._shutdown_event.is_set():
-            task_data_queue: asyncio.Future[SensorData] = asyncio.create_task(self._data_queue.get())
-            task_webcam_data: asyncio.Future[WebcamData] = asyncio.create_task(self._webcam_callback.get_data())
-            task_shutdown_event = asyncio.create_task(self._shutdown_event.wait())
+        while True:
+            await self._data_wakeup.wait()
+            self._data_wakeup.clear()
 
-            done_tasks, pending_tasks = await asyncio.wait(
-                [task_data_queue, task_webcam_data, task_shutdown_event],
-                return_when=asyncio.FIRST_COMPLETED
-            )
+            while not self._data_queue.empty():
+                # we got sensor data!
+                await self._process_data(self._data_queue.get_nowait())
 
-            # cancel any pending tasks
-            [t.cancel() for t in pending_tasks]
-            # return_exceptions=True - prevent raise of asyncio.CancelledError
-            await asyncio.gather(*pending_tasks, return_exceptions=True)
+            if webcam_data := self._webcam_callback.take_data():
+                await self._process_webcam(webcam_data)
 
-            if self._shutdown_event.is_set():
-                # exit immediately
-                break
+    async def _process_data(self, data: SensorData):
+        if self._qc:
+            self._qc.process(data)
+        if self._history:
+            self._history.add(data)
+        try:
+            # we also send the data that failed during the previous attempt
+            await self._frontend.send_data([*self._failed_data, data])
+            self._failed_data.clear()
+        except asyncio.CancelledError:
+            raise
+        except:
+            # TODO proper exception handling
+            _LOGGER.warning("Failed to send data", exc_info=True)
+            # store the data for a later retry attempt
+            self._failed_data.append(data)
 
-            if task_data_queue in done_tasks:
-                # _LOGGER.debug(f"Collecting data")
-                # we got sensor data!
-                data = task_data_queue.result()
+    async def _process_webcam(self, webcam_data: WebcamData):
+        if self._timelapse:
+            self._timelapse.add(webcam_data)
+        if self._timelapse and not self._timelapse.upload_stills:
+            return
+
+        try:
+            await self._frontend.send_webcam(webcam_data)
+        except asyncio.CancelledError:
+            raise
+        except:
+            # TODO proper exception handling
+            _LOGGER.warning("Failed to send webcam data", exc_info=True)
+
+    async def _reload_config_start(self):
+        while True:
+            await self._reload_event.wait()
+            self._reload_event.clear()
+            await self._reload_config()
+
+    async def _reload_config(self):
+        try:
+            config = self._load_config()
+        except (OSError, tomllib.TOMLDecodeError):
+            _LOGGER.error(f"Unable to load configuration from {self._config_file}, keeping the current one",
+                          exc_info=True)
+            return
+
+        changed = {section for section in config.keys() | self.config.keys()
+                   if config.get(section) != self.config.get(section)}
+        if not changed:
+            _LOGGER.info("Configuration reloaded, nothing changed")
+            return
+        _LOGGER.info(f"Configuration reloaded, restarting: {', '.join(sorted(changed))}")
+
+        reload_handlers = {
+            'backend': self._reload_backend,
+            'webcam': self._reload_webcam,
+            'frontend': self._reload_frontend,
+            'qc': self._reload_qc,
+            'history': self._reload_history,
+            'timelapse': self._reload_timelapse,
+            'diagnostics': self._reload_diagnostics,
+        }
+        # the time-lapse builder depends on the webcam
+        if 'webcam' in changed:
+            changed.add('timelapse')
+
+        # components are created before stopping the old ones: a configuration error keeps the old component
+        for section, reload_component in reload_handlers.items():
+            if section in changed:
                 try:
-                    # we also send the data that failed during the previous attempt
-                    await self._frontend.send_data([*self._failed_data, data])
-                    self._failed_data.clear()
-                except asyncio.CancelledError:
-                    continue
-                except:
-                    # TODO proper exception handling
-                    _LOGGER.warning("Failed to send data", exc_info=True)
-                    # store the data for a later retry attempt
-                    self._failed_data.append(data)
-
-            if task_webcam_data in done_tasks:
-                webcam_data = task_webcam_data.result()
-                if webcam_data:
-                    try:
-                        await self._frontend.send_webcam(webcam_data)
-                    except asyncio.CancelledError:
-                        continue
-                    except:
-                        # TODO proper exception handling
-                        _LOGGER.warning("Failed to send webcam data", exc_info=True)
+                    await reload_component(config.get(section))
+                    if section in config:
+                        self.config[section] = config[section]
+                    else:
+                        self.config.pop(section, None)
+                except Exception:
+                    _LOGGER.error(f"Unable to apply [{section}] configuration, keeping the current one",
+                                  exc_info=True)
+
+        if restart_needed := changed - reload_handlers.keys():
+            _LOGGER.warning(f"Configuration changes requiring a restart: {', '.join(sorted(restart_needed))}")
+        self._register_status_sources()
+
+    async def _reload_backend(self, config: dict | None):
+        backend = self._create_sensor_backend(config, SensorBackendQueue(self._data_queue, self._data_wakeup))
+        await self._backend.stop()
+        self._backend = backend
+        await self._backend.start()
+
+    async def _reload_webcam(self, config: dict | None):
+        webcam = self._create_webcam_backend(config, self._webcam_callback) if config is not None else None
+        if webcam:
+            # the old webcam keeps running if the new one fails to start
+            try:
+                await webcam.start()
+            except Exception:
+                await webcam.stop()
+                raise
+        old_webcam = self._webcam
+        self._webcam = webcam
+        if old_webcam:
+            await old_webcam.stop()
+
+    async def _reload_frontend(self, config: dict | None):
+        frontend = self._create_frontend(config)
+        frontend.upload_listener = self._webcam_uploaded
+        # close the old frontend first: the new one might need the same resources (e.g. the listening port)
+        await self._frontend.close()
+        try:
+            await frontend.setup()
+        except Exception:
+            await frontend.close()
+            # go back to the old frontend
+            await self._frontend.setup()
+            raise
+        self._frontend = frontend
+
+    async def _reload_qc(self, config: dict | None):
+        self._qc = QualityControl(config) if config is not None else None
+
+    async def _reload_history(self, config: dict | None):
+        history = HistoryStore(config) if config is not None else None
+        if history:
+            # the current store is kept if the new one can't be opened (e.g. bad path)
+            history.open()
+        old_history = self._history
+        self._history = history
+        if old_history:
+            old_history.close()
+
+    async def _reload_timelapse(self, config: dict | None):
+        timelapse = self._create_timelapse(config) if config is not None and self._webcam else None
+        if self._timelapse:
+            await self._timelapse.stop()
+        self._timelapse = timelapse
+        if self._timelapse:
+            self._timelapse.start()
+
+    async def _reload_diagnostics(self, config: dict | None):
+        self._diagnostics.stop_session()
+        self._diagnostics = Diagnostics(config or {})
 
 
 def is_journal_enabled():
@@ -151,4 +373,14 @@ def main(args):
     # logging.getLogger("httpx").setLevel(logging.DEBUG)
     # logging.getLogger("httpcore").setLevel(logging.DEBUG)
 
-    asyncio.run(WeatherDaemon(args).run())
+    daemon = WeatherDaemon(args)
+    loop_factory = None
+    if daemon.config.get('daemon', {}).get('event_loop', 'asyncio') == 'uvloop':
+        try:
+            import uvloop
+            loop_factory = uvloop.new_event_loop
+        except ImportError:
+            _LOGGER.warning("uvloop is not installed, using the default event loop")
+
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(daemon.run())
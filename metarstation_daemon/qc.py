@@ -0,0 +1,195 @@
+import bisect
+import collections
+import dataclasses
+import logging
+import math
+
+from .data import SensorData
+
+_LOGGER = logging.getLogger(__name__)
+
+QC_OK = 'ok'
+QC_RANGE = 'range'
+QC_RATE = 'rate'
+QC_SPIKE = 'spike'
+
+ACTION_FLAG = 'flag'
+"""Keep suspect values, marking them in SensorData.qc_flags."""
+
+ACTION_DROP = 'drop'
+"""Remove suspect values (marking them in SensorData.qc_flags too)."""
+
+_MAD_SCALE = 1.4826
+"""Scale factor making the MAD a consistent estimator of the standard deviation for normally distributed data."""
+
+DEFAULT_FIELDS = {
+    'temperature': {'min': -50, 'max': 60, 'max_rate_per_min': 3},
+    'humidity': {'min': 0, 'max': 100},
+    'dew_point': {'min': -60, 'max': 40},
+    'pressure': {'min': 500, 'max': 1100, 'max_rate_per_min': 1,
+                 'spike_window': 15, 'spike_threshold': 6, 'spike_min_deviation': 1},
+    'illumination': {'min': 0, 'max': 200000},
+    'wind_speed': {'min': 0, 'max': 75,
+                   'spike_window': 15, 'spike_threshold': 6, 'spike_min_deviation': 5},
+    'gust_speed': {'min': 0, 'max': 90},
+    'wind_direction': {'min': 0, 'max': 360},
+    'uv_index': {'min': 0, 'max': 20},
+    'precipitation': {'min': 0, 'max': 500},
+}
+"""Default checks, merged with the ones from the configuration."""
+
+_CHECKED_FIELDS = {f.name for f in dataclasses.fields(SensorData)} - {'timestamp', 'qc_flags'}
+"""Fields of SensorData that can be checked."""
+
+
+def _kth_smallest(a, b, k: int) -> float:
+    """
+    k-th smallest (0-based) element of the union of two sorted sequences, in O(log n).
+    Sequences only need to support indexing and len().
+    """
+    # find how many elements to take from a (the rest comes from b) to collect the k+1 smallest elements
+    lo, hi = max(0, k + 1 - len(b)), min(k + 1, len(a))
+    while lo < hi:
+        i = (lo + hi) // 2
+        if a[i] < b[k - i]:
+            lo = i + 1
+        else:
+            hi = i
+    i, j = lo, k + 1 - lo
+    return max(a[i - 1] if i > 0 else -math.inf, b[j - 1] if j > 0 else -math.inf)
+
+
+class _Deviations:
+    """Absolute deviations from a center, seen as a sorted sequence without materializing it."""
+
+    def __init__(self, values: list[float], center: float, split: int, below: bool):
+        self._values = values
+        self._center = center
+        self._split = split
+        self._below = below
+
+    def __len__(self):
+        return self._split if self._below else len(self._values) - self._split
+
+    def __getitem__(self, index: int) -> float:
+        if self._below:
+            return self._center - self._values[self._split - 1 - index]
+        else:
+            return self._values[self._split + index] - self._center
+
+
+class RollingWindow:
+    """
+    The latest values of a series, also kept sorted: median and MAD (median absolute deviation) are computed
+    with binary searches on the sorted values, without scanning the window.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._values: collections.deque[float] = collections.deque()
+        self._sorted: list[float] = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, value: float):
+        self._values.append(value)
+        bisect.insort(self._sorted, value)
+        if len(self._values) > self.size:
+            del self._sorted[bisect.bisect_left(self._sorted, self._values.popleft())]
+
+    def median(self) -> float:
+        n = len(self._sorted)
+        return (self._sorted[(n - 1) // 2] + self._sorted[n // 2]) / 2
+
+    def mad(self) -> float:
+        n = len(self._sorted)
+        center = self.median()
+        split = bisect.bisect_left(self._sorted, center)
+        below = _Deviations(self._sorted, center, split, True)
+        above = _Deviations(self._sorted, center, split, False)
+        return (_kth_smallest(below, above, (n - 1) // 2) + _kth_smallest(below, above, n // 2)) / 2
+
+
+class _FieldCheck:
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.min: float | None = config.get('min', None)
+        self.max: float | None = config.get('max', None)
+        self.max_rate_per_min: float | None = config.get('max_rate_per_min', None)
+        self.spike_threshold: float = config.get('spike_threshold', 6)
+        self.spike_min_deviation: float = config.get('spike_min_deviation', 0)
+        self.window = RollingWindow(config['spike_window']) if 'spike_window' in config else None
+        self.counters: collections.Counter[str] = collections.Counter()
+        self._last_value: float | None = None
+        self._last_timestamp = None
+
+    def check(self, data: SensorData) -> str:
+        value = getattr(data, self.name)
+        result = self._check(value, data)
+        self.counters[result] += 1
+        return result
+
+    def _check(self, value, data: SensorData) -> str:
+        if (self.min is not None and value < self.min) or (self.max is not None and value > self.max):
+            return QC_RANGE
+
+        result = QC_OK
+        if self.window is not None:
+            # spike detection only once the window is half full
+            if len(self.window) >= self.window.size // 2:
+                deviation = abs(value - self.window.median())
+                if deviation > max(self.spike_threshold * _MAD_SCALE * self.window.mad(), self.spike_min_deviation):
+                    result = QC_SPIKE
+            # suspect values are part of the window too: a persistent change will become the new normal
+            self.window.add(value)
+
+        if result == QC_OK and self.max_rate_per_min is not None and self._last_value is not None:
+            elapsed_mins = (data.timestamp - self._last_timestamp).total_seconds() / 60
+            if elapsed_mins > 0 and abs(value - self._last_value) / elapsed_mins > self.max_rate_per_min:
+                result = QC_RATE
+
+        # compare the rate of change against the last good value only
+        if result == QC_OK:
+            self._last_value = value
+            self._last_timestamp = data.timestamp
+
+        return result
+
+
+class QualityControl:
+    """
+    Streaming quality control of sensor readings: range checks, rate of change limits and spike detection
+    (deviation from the rolling median, in units of MAD), independently for each field.
+    """
+
+    def __init__(self, config: dict):
+        self.action: str = config.get('action', ACTION_FLAG)
+        if self.action not in (ACTION_FLAG, ACTION_DROP):
+            raise ValueError(f'Unknown QC action: {self.action}')
+
+        fields_config = {name: dict(checks) for name, checks in DEFAULT_FIELDS.items()}
+        for name, checks in config.get('fields', {}).items():
+            if name not in _CHECKED_FIELDS:
+                raise ValueError(f'Unknown QC field: {name}')
+            fields_config.setdefault(name, {}).update(checks)
+        self._checks = [_FieldCheck(name, checks) for name, checks in fields_config.items()]
+
+    def process(self, data: SensorData):
+        """Check all fields of the reading, flagging or dropping suspect values."""
+        for check in self._checks:
+            if getattr(data, check.name) is None:
+                continue
+
+            result = check.check(data)
+            if result != QC_OK:
+                _LOGGER.info(f"QC: {check.name}={getattr(data, check.name)} failed {result} check")
+                if data.qc_flags is None:
+                    data.qc_flags = {}
+                data.qc_flags[check.name] = result
+                if self.action == ACTION_DROP:
+                    setattr(data, check.name, None)
+
+    def counters(self) -> dict[str, dict[str, int]]:
+        return {check.name: dict(check.counters) for check in self._checks}
@@ -0,0 +1,190 @@
+"""
+Compact binary log for recording raw backend input (BLE advertisements, camera stream segments) and replaying it later.
+
+File layout: a header (magic + version), followed by records. Each record is made of a fixed header
+(kind, UNIX timestamp, payload length) and a payload whose format depends on the record kind.
+All integers are little-endian.
+"""
+import logging
+import struct
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+_LOGGER = logging.getLogger(__name__)
+
+_MAGIC = b'MSREC'
+_VERSION = 1
+_FILE_HEADER = struct.Struct('<5sB')
+_RECORD_HEADER = struct.Struct('<BdI')
+
+RECORD_BLE_ADVERTISEMENT = 1
+"""A BLE advertisement received from a device."""
+
+RECORD_STREAM_SEGMENTS = 2
+"""Camera stream data (concatenated MPEG-TS segments) used for taking a snapshot."""
+
+
+@dataclass(kw_only=True)
+class Record:
+
+    kind: int
+    """Record kind (one of the RECORD_* constants)."""
+
+    timestamp: float
+    """Record timestamp (UNIX epoch)."""
+
+    payload: bytes
+    """Raw record payload."""
+
+
+@dataclass(kw_only=True)
+class RecordedAdvertisement:
+
+    address: str
+    local_name: str | None
+    rssi: int
+    tx_power: int | None
+    service_data: dict[str, bytes]
+    manufacturer_data: dict[int, bytes]
+    service_uuids: list[str]
+
+
+_NO_TX_POWER = -128
+
+
+def _pack_bytes(data: bytes) -> bytes:
+    return struct.pack('<H', len(data)) + data
+
+
+def _pack_str(data: str | None) -> bytes:
+    return _pack_bytes((data or '').encode())
+
+
+class _Unpacker:
+    def __init__(self, data: bytes):
+        self._data = data
+        self._offset = 0
+
+    def unpack(self, fmt: str) -> tuple:
+        values = struct.unpack_from(fmt, self._data, self._offset)
+        self._offset += struct.calcsize(fmt)
+        return values
+
+    def bytes(self) -> bytes:
+        (length,) = self.unpack('<H')
+        data = self._data[self._offset:self._offset + length]
+        self._offset += length
+        return data
+
+    def str(self) -> str:
+        return self.bytes().decode()
+
+    def uuid(self) -> str:
+        data = self._data[self._offset:self._offset + 16]
+        self._offset += 16
+        return str(uuid.UUID(bytes=data))
+
+
+def pack_advertisement(address: str, advertisement_data) -> bytes:
+    """Serialize a bleak AdvertisementData (and the address of the advertising device)."""
+    tx_power = advertisement_data.tx_power if advertisement_data.tx_power is not None else _NO_TX_POWER
+    payload = [
+        _pack_str(address),
+        _pack_str(advertisement_data.local_name),
+        struct.pack('<bb', advertisement_data.rssi, tx_power),
+        struct.pack('<B', len(advertisement_data.service_data)),
+    ]
+    for service_uuid, data in advertisement_data.service_data.items():
+        payload.append(uuid.UUID(service_uuid).bytes + _pack_bytes(data))
+    payload.append(struct.pack('<B', len(advertisement_data.manufacturer_data)))
+    for company_id, data in advertisement_data.manufacturer_data.items():
+        payload.append(struct.pack('<H', company_id) + _pack_bytes(data))
+    payload.append(struct.pack('<B', len(advertisement_data.service_uuids)))
+    for service_uuid in advertisement_data.service_uuids:
+        payload.append(uuid.UUID(service_uuid).bytes)
+    return b''.join(payload)
+
+
+def unpack_advertisement(payload: bytes) -> RecordedAdvertisement:
+    unpacker = _Unpacker(payload)
+    address = unpacker.str()
+    local_name = unpacker.str() or None
+    rssi, tx_power = unpacker.unpack('<bb')
+    (count,) = unpacker.unpack('<B')
+    service_data = {}
+    for _ in range(count):
+        service_uuid = unpacker.uuid()
+        service_data[service_uuid] = unpacker.bytes()
+    (count,) = unpacker.unpack('<B')
+    manufacturer_data = {}
+    for _ in range(count):
+        (company_id,) = unpacker.unpack('<H')
+        manufacturer_data[company_id] = unpacker.bytes()
+    (count,) = unpacker.unpack('<B')
+    service_uuids = [unpacker.uuid() for _ in range(count)]
+    return RecordedAdvertisement(
+        address=address,
+        local_name=local_name,
+        rssi=rssi,
+        tx_power=tx_power if tx_power != _NO_TX_POWER else None,
+        service_data=service_data,
+        manufacturer_data=manufacturer_data,
+        service_uuids=service_uuids,
+    )
+
+
+class RecordWriter:
+    """Appends records to a log file. Records are flushed immediately so that a crash loses as little as possible."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._fp: BinaryIO | None = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fp = open(self.path, 'ab')
+        if self._fp.tell() == 0:
+            self._fp.write(_FILE_HEADER.pack(_MAGIC, _VERSION))
+        _LOGGER.info(f"Recording to {self.path}")
+
+    def close(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+
+    def write(self, kind: int, payload: bytes, timestamp: float | None = None):
+        if not self._fp:
+            self.open()
+        if timestamp is None:
+            timestamp = time.time()
+        self._fp.write(_RECORD_HEADER.pack(kind, timestamp, len(payload)))
+        self._fp.write(payload)
+        self._fp.flush()
+
+    def write_advertisement(self, address: str, advertisement_data):
+        self.write(RECORD_BLE_ADVERTISEMENT, pack_advertisement(address, advertisement_data))
+
+    def write_stream_segments(self, data: bytes):
+        self.write(RECORD_STREAM_SEGMENTS, data)
+
+
+def read_records(path: str | Path, kind: int | None = None) -> Iterator[Record]:
+    """Iterate over the records in a log file, optionally filtering by kind. A truncated last record is ignored."""
+    with open(path, 'rb') as fp:
+        magic, version = _FILE_HEADER.unpack(fp.read(_FILE_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Not a recording file (or unsupported version): {path}")
+
+        while header := fp.read(_RECORD_HEADER.size):
+            if len(header) < _RECORD_HEADER.size:
+                break
+            record_kind, timestamp, length = _RECORD_HEADER.unpack(header)
+            payload = fp.read(length)
+            if len(payload) < length:
+                _LOGGER.warning(f"Truncated record at end of {path}")
+                break
+            if kind is None or record_kind == kind:
+                yield Record(kind=record_kind, timestamp=timestamp, payload=payload)
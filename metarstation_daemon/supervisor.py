@@ -0,0 +1,125 @@
+"""
+Supervision of the long-running tasks of the daemon: tasks run inside a TaskGroup and are restarted (with
+exponential backoff) according to their restart policy, instead of silently dying on the first exception.
+"""
+import asyncio
+import contextvars
+import enum
+import logging
+import time
+from typing import Callable, Coroutine
+
+_LOGGER = logging.getLogger(__name__)
+
+_RESTART_MIN_SECS = 1
+_RESTART_MAX_SECS = 60
+
+_STABLE_SECS = 60
+"""A task running at least this long before failing is restarted right away (backoff is reset)."""
+
+_current: contextvars.ContextVar['Supervisor | None'] = contextvars.ContextVar('supervisor', default=None)
+
+
+class RestartPolicy(enum.Enum):
+    NEVER = 'never'
+    """Failures are only logged."""
+    ON_FAILURE = 'on_failure'
+    """Restart if the task raised an exception."""
+    ALWAYS = 'always'
+    """Restart whenever the task ends, unless cancelled."""
+
+
+class SupervisedTask:
+    """Handle to a supervised task: cancelling it stops restarts as well."""
+
+    def __init__(self, name: str, factory: Callable[[], Coroutine], restart: RestartPolicy):
+        self.name = name
+        self.factory = factory
+        self.restart = restart
+        self.restarts = 0
+        self.last_error: str | None = None
+        self.task: asyncio.Task | None = None
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+
+    def done(self) -> bool:
+        return self.task is not None and self.task.done()
+
+    async def run(self):
+        backoff_secs = _RESTART_MIN_SECS
+        while True:
+            started = time.monotonic()
+            try:
+                await self.factory()
+                if self.restart != RestartPolicy.ALWAYS:
+                    return
+                _LOGGER.warning(f"Task {self.name} ended, restarting")
+            except Exception as e:
+                self.last_error = repr(e)
+                if self.restart == RestartPolicy.NEVER:
+                    _LOGGER.error(f"Task {self.name} failed", exc_info=True)
+                    return
+                _LOGGER.error(f"Task {self.name} failed, restarting", exc_info=True)
+
+            if time.monotonic() - started >= _STABLE_SECS:
+                backoff_secs = _RESTART_MIN_SECS
+            await asyncio.sleep(backoff_secs)
+            backoff_secs = min(backoff_secs * 2, _RESTART_MAX_SECS)
+            self.restarts += 1
+
+
+class Supervisor:
+    """
+    Owns a TaskGroup running all supervised tasks. While the supervisor is active (inside "async with"), spawn()
+    called from its context (and from tasks started in it) supervises the new task.
+    """
+
+    def __init__(self):
+        self._group: asyncio.TaskGroup | None = None
+        self._children: list[SupervisedTask] = []
+        self._token: contextvars.Token | None = None
+
+    async def __aenter__(self):
+        self._group = asyncio.TaskGroup()
+        await self._group.__aenter__()
+        self._token = _current.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        _current.reset(self._token)
+        try:
+            return await self._group.__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._group = None
+
+    def spawn(self, name: str, factory: Callable[[], Coroutine],
+              restart: RestartPolicy = RestartPolicy.ON_FAILURE) -> SupervisedTask:
+        """
+        Start a supervised task.
+        :param name: task name
+        :param factory: called to create the coroutine at every (re)start
+        :param restart: restart policy
+        """
+        child = SupervisedTask(name, factory, restart)
+        child.task = self._group.create_task(child.run(), name=name)
+        self._children = [c for c in self._children if not c.done()] + [child]
+        return child
+
+    def cancel_all(self):
+        for child in self._children:
+            child.cancel()
+
+    def status(self) -> dict:
+        return {child.name: {'restarts': child.restarts, 'last_error': child.last_error, 'done': child.done()}
+                for child in self._children}
+
+
+def spawn(name: str, factory: Callable[[], Coroutine],
+          restart: RestartPolicy = RestartPolicy.ON_FAILURE) -> SupervisedTask | asyncio.Task:
+    """Start a task under the current supervisor, or a plain task if there is none (e.g. in tests)."""
+    supervisor = _current.get()
+    if supervisor is None or supervisor._group is None:
+        return asyncio.get_running_loop().create_task(factory(), name=name)
+    return supervisor.spawn(name, factory, restart)
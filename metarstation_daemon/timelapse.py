@@ -0,0 +1,262 @@
+"""
+Time-lapse clips built on the device from webcam snapshots.
+
+Snapshots are piped to a long-running ffmpeg process as they arrive, which encodes them to a fragmented MP4
+(H.264) file: each frame is encoded right away, so there is no burst of work when a clip is finished and a partial
+file is still playable. Clips are cut at fixed boundaries of wall clock time (every hour by default) and uploaded
+through the frontend.
+"""
+import asyncio
+import collections
+import datetime
+import logging
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from .backend.ffmpeg import IMAGE_TYPE_JPEG, IMAGE_TYPE_WEBP, print_ffmpeg_logs
+from .data import WebcamData, TimelapseData
+
+_LOGGER = logging.getLogger(__name__)
+
+VIDEO_TYPE_MP4 = 'video/mp4'
+
+_INPUT_FORMATS = {
+    IMAGE_TYPE_JPEG: 'jpeg_pipe',
+    IMAGE_TYPE_WEBP: 'webp_pipe',
+}
+"""ffmpeg demuxers for the image types that can be appended to a clip."""
+
+_FRAME_QUEUE_LIMIT = 10
+
+_PENDING_LIMIT = 24
+"""Maximum number of finished clips waiting to be uploaded (the oldest ones are dropped)."""
+
+_UPLOAD_RETRY_MIN_SECS = 30
+_UPLOAD_RETRY_MAX_SECS = 1800
+
+_STOP_TIMEOUT_SECS = 30
+"""Time allowed for finishing the current clip when stopping."""
+
+
+class _Segment:
+    """A clip being encoded by a ffmpeg process, fed with images through its standard input."""
+
+    def __init__(self, path: Path, image_type: str, start: datetime.datetime, ends_at: float):
+        self.path = path
+        self.image_type = image_type
+        self.start = start
+        self.end = start
+        self.ends_at = ends_at
+        """UNIX timestamp at which the clip will be cut."""
+        self.frames = 0
+        self.process: asyncio.subprocess.Process | None = None
+        self.log_task: asyncio.Task | None = None
+
+    async def append(self, data: WebcamData):
+        self.process.stdin.write(data.image_data)
+        await self.process.stdin.drain()
+        self.frames += 1
+        self.end = data.timestamp
+
+    async def finish(self) -> bool:
+        self.process.stdin.close()
+        await self.process.wait()
+        await self.log_task
+        return self.process.returncode == 0
+
+    def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+        self.log_task.cancel()
+        self.path.unlink(missing_ok=True)
+
+
+class TimelapseBuilder:
+
+    def __init__(self, config: dict, upload):
+        """
+        :param config: configuration parameters
+        :param upload: coroutine function uploading a finished clip
+        """
+        self.segment_secs: int = config.get('segment_secs', 3600)
+        self.frame_rate: int = config.get('frame_rate', 24)
+        self.height: int = config.get('height', 720)
+        self.crf: int = config.get('crf', 28)
+        self.preset: str = config.get('preset', 'veryfast')
+        self.threads: int = config.get('threads', 1)
+        self.nice: int = config.get('nice', 19)
+        self.upload_stills: bool = config.get('upload_stills', True)
+        self._upload = upload
+        self._frames: asyncio.Queue[WebcamData] = asyncio.Queue(maxsize=_FRAME_QUEUE_LIMIT)
+        self._pending: collections.deque[TimelapseData] = collections.deque(maxlen=_PENDING_LIMIT)
+        self._segment: _Segment | None = None
+        self._tempdir = tempfile.mkdtemp('weather-station-timelapse')
+        self._task: asyncio.Task | None = None
+        self._upload_retry_secs = 0.0
+        self._upload_retry_at = 0.0
+        self.dropped = 0
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run(), name='timelapse')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._segment:
+            # a partial clip is still a valid one (fragmented MP4), don't throw away the frames encoded so far
+            try:
+                await asyncio.wait_for(self._finish_segment(), _STOP_TIMEOUT_SECS)
+            except Exception:
+                _LOGGER.warning("Unable to finish time-lapse clip", exc_info=True)
+        # last chance for clips not uploaded yet
+        await self._upload_pending()
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    def add(self, data: WebcamData):
+        """Queue a snapshot to be appended to the current clip."""
+        if data.image_type not in _INPUT_FORMATS:
+            _LOGGER.debug(f"Can't use {data.image_type} images in time-lapse clips")
+            return
+        try:
+            self._frames.put_nowait(data)
+        except asyncio.QueueFull:
+            # encoder is too slow
+            self.dropped += 1
+
+    def status(self) -> dict:
+        return {
+            'frames': self._segment.frames if self._segment else 0,
+            'pending_clips': len(self._pending),
+            'dropped_frames': self.dropped,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                frame = await asyncio.wait_for(self._frames.get(), self._next_timeout())
+            except asyncio.TimeoutError:
+                frame = None
+
+            if self._segment and ((frame is None and time.time() >= self._segment.ends_at) or
+                                  (frame and (frame.timestamp.timestamp() >= self._segment.ends_at or
+                                              frame.image_type != self._segment.image_type))):
+                await self._finish_segment()
+
+            if self._pending and time.monotonic() >= self._upload_retry_at:
+                await self._upload_pending()
+
+            if frame:
+                try:
+                    if not self._segment:
+                        await self._start_segment(frame)
+                    await self._segment.append(frame)
+                except (OSError, ConnectionError):
+                    # most likely ffmpeg died, its output is in the logs
+                    _LOGGER.warning('Error encoding time-lapse frame, discarding clip', exc_info=True)
+                    if self._segment:
+                        self._segment.kill()
+                        self._segment = None
+
+    def _next_timeout(self) -> float | None:
+        """Time until the current clip has to be cut or a failed upload retried."""
+        timeouts = []
+        if self._segment:
+            timeouts.append(self._segment.ends_at - time.time())
+        if self._pending:
+            timeouts.append(self._upload_retry_at - time.monotonic())
+        return max(min(timeouts), 0) if timeouts else None
+
+    async def _start_segment(self, frame: WebcamData):
+        timestamp = frame.timestamp.timestamp()
+        ends_at = (timestamp // self.segment_secs + 1) * self.segment_secs
+        path = Path(self._tempdir) / f"timelapse-{frame.timestamp:%Y%m%d%H%M%S}.mp4"
+        segment = _Segment(path, frame.image_type, frame.timestamp, ends_at)
+
+        cmd = [
+            'nice',
+            '-n',
+            str(self.nice),
+            'ffmpeg',
+            '-nostats',
+            '-loglevel',
+            'error',
+            '-f',
+            _INPUT_FORMATS[frame.image_type],
+            '-framerate',
+            str(self.frame_rate),
+            '-i',
+            'pipe:0',
+            '-an',
+            # snapshot size might change (e.g. adaptive encoding), the clip size can't
+            '-vf',
+            f'scale=-2:{self.height},format=yuv420p',
+            '-c:v',
+            'libx264',
+            '-preset',
+            self.preset,
+            '-crf',
+            str(self.crf),
+            '-threads',
+            str(self.threads),
+            '-g',
+            str(self.frame_rate),
+            # fragmented MP4: frames are written as they are encoded
+            '-movflags',
+            'frag_keyframe+empty_moov+default_base_moof',
+            '-f',
+            'mp4',
+            '-y',
+            str(path),
+        ]
+        _LOGGER.debug(f"cmdline: {cmd}")
+        segment.process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        # keep reading logs or ffmpeg will block on a full pipe
+        segment.log_task = asyncio.get_running_loop().create_task(print_ffmpeg_logs(segment.process.stderr),
+                                                                  name='timelapse-ffmpeg-logs')
+        self._segment = segment
+        _LOGGER.debug(f"Time-lapse clip started at {frame.timestamp}")
+
+    async def _finish_segment(self):
+        segment = self._segment
+        self._segment = None
+        try:
+            if await segment.finish() and segment.frames > 0:
+                clip = TimelapseData(
+                    start=segment.start,
+                    end=segment.end,
+                    frames=segment.frames,
+                    video_data=segment.path.read_bytes(),
+                    video_type=VIDEO_TYPE_MP4,
+                )
+                _LOGGER.info(f"Time-lapse clip ready: {clip.frames} frames, {len(clip.video_data)} bytes")
+                self._pending.append(clip)
+            else:
+                _LOGGER.warning(f"Time-lapse encoding failed (ffmpeg exit code {segment.process.returncode})")
+        finally:
+            segment.kill()
+
+    async def _upload_pending(self):
+        while self._pending:
+            try:
+                await self._upload(self._pending[0])
+                self._pending.popleft()
+                self._upload_retry_secs = 0
+            except asyncio.CancelledError:
+                raise
+            except:
+                # TODO proper exception handling
+                self._upload_retry_secs = min(max(self._upload_retry_secs * 2, _UPLOAD_RETRY_MIN_SECS),
+                                              _UPLOAD_RETRY_MAX_SECS)
+                self._upload_retry_at = time.monotonic() + self._upload_retry_secs
+                _LOGGER.warning(f"Failed to send time-lapse clip, retrying in {self._upload_retry_secs}s",
+                                exc_info=True)
+                break
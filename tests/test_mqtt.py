@@ -0,0 +1,216 @@
+"""
+MqttDataFrontend against a local embedded broker (amqtt).
+"""
+import asyncio
+import datetime
+import json
+import socket
+
+import aiomqtt
+import pytest
+
+from metarstation_daemon.data import SensorData
+from metarstation_daemon.frontend.mqtt import MqttDataFrontend, pack_reading
+
+amqtt_broker = pytest.importorskip('amqtt.broker')
+
+pytestmark = pytest.mark.filterwarnings('ignore::DeprecationWarning')
+
+_TIMEOUT_SECS = 15
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _create_broker(port: int):
+    return amqtt_broker.Broker({
+        'listeners': {'default': {'type': 'tcp', 'bind': f'127.0.0.1:{port}'}},
+        'sys_interval': 0,
+        'auth': {'allow-anonymous': True, 'plugins': ['auth_anonymous']},
+        'topic-check': {'enabled': False},
+    })
+
+
+def _create_frontend(port: int, **config) -> MqttDataFrontend:
+    return MqttDataFrontend({'host': '127.0.0.1', 'port': port, 'reconnect_max_secs': 1} | config)
+
+
+def _reading(index: int) -> SensorData:
+    return SensorData(timestamp=datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC) + datetime.timedelta(minutes=index),
+                      temperature=float(index))
+
+
+class _Subscriber:
+    """Collects the messages of a topic, reconnecting if the broker goes away."""
+
+    def __init__(self, port: int, topic: str):
+        self.port = port
+        self.topic = topic
+        self.messages: list[aiomqtt.Message] = []
+        self.subscribed = asyncio.Event()
+        self._received = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                async with aiomqtt.Client('127.0.0.1', self.port) as client:
+                    await client.subscribe(self.topic, qos=1)
+                    self.subscribed.set()
+                    async for message in client.messages:
+                        self.messages.append(message)
+                        self._received.set()
+            except aiomqtt.MqttError:
+                self.subscribed.clear()
+                await asyncio.sleep(0.1)
+
+    async def wait_for(self, predicate):
+        async with asyncio.timeout(_TIMEOUT_SECS):
+            while not predicate(self.messages):
+                self._received.clear()
+                await self._received.wait()
+
+    def temperatures(self) -> list[float]:
+        return [json.loads(message.payload)['temperature'] for message in self.messages]
+
+    def close(self):
+        self._task.cancel()
+
+
+def test_publish():
+    async def run():
+        port = _free_port()
+        broker = _create_broker(port)
+        await broker.start()
+        subscriber = _Subscriber(port, 'metarstation/readings/#')
+        frontend = _create_frontend(port, binary_payload=True)
+        try:
+            await subscriber.subscribed.wait()
+            await frontend.setup()
+            readings = [_reading(i) for i in range(50)]
+            await frontend.send_data(readings)
+
+            await subscriber.wait_for(lambda messages: len(messages) >= 100)
+            json_messages = [m for m in subscriber.messages if m.topic.matches('metarstation/readings')]
+            binary_messages = [m for m in subscriber.messages if m.topic.matches('metarstation/readings/binary')]
+            assert [json.loads(m.payload)['temperature'] for m in json_messages] == list(range(50))
+            assert [m.payload for m in binary_messages] == [pack_reading(r) for r in readings]
+        finally:
+            await frontend.close()
+            subscriber.close()
+            await broker.shutdown()
+
+    asyncio.run(run())
+
+
+def test_retained_latest():
+    async def run():
+        port = _free_port()
+        broker = _create_broker(port)
+        await broker.start()
+        subscriber = _Subscriber(port, 'metarstation/#')
+        frontend = _create_frontend(port)
+        try:
+            await subscriber.subscribed.wait()
+            await frontend.setup()
+            await frontend.send_data([_reading(1), _reading(2)])
+            await frontend.send_data([_reading(3)])
+            await subscriber.wait_for(lambda messages: any(m.topic.matches('metarstation/latest') and
+                                                           json.loads(m.payload)['temperature'] == 3
+                                                           for m in messages))
+
+            # a client connecting later gets the latest reading only
+            latest = _Subscriber(port, 'metarstation/#')
+            await latest.wait_for(lambda messages: len(messages) >= 1)
+            await asyncio.sleep(0.5)
+            latest.close()
+            # (amqtt might deliver retained messages twice)
+            assert {str(m.topic) for m in latest.messages} == {'metarstation/latest'}
+            assert set(latest.temperatures()) == {3.0}
+        finally:
+            await frontend.close()
+            subscriber.close()
+            await broker.shutdown()
+
+    asyncio.run(run())
+
+
+def test_offline_buffer(monkeypatch):
+    async def run():
+        # hold publishing after connecting until there is someone listening
+        listening = asyncio.Event()
+        publish_messages = MqttDataFrontend._publish_messages
+
+        async def publish_when_listening(self, client):
+            await listening.wait()
+            await publish_messages(self, client)
+
+        monkeypatch.setattr(MqttDataFrontend, '_publish_messages', publish_when_listening)
+
+        port = _free_port()
+        frontend = _create_frontend(port, buffer_limit=10)
+        broker = _create_broker(port)
+        subscriber = None
+        try:
+            # broker not running yet
+            await frontend.setup()
+            await frontend.send_data([_reading(i) for i in range(15)])
+            await asyncio.sleep(1.5)
+            assert frontend.dropped == 5
+
+            await broker.start()
+            subscriber = _Subscriber(port, 'metarstation/readings')
+            await subscriber.subscribed.wait()
+            listening.set()
+
+            # the oldest readings were dropped
+            await subscriber.wait_for(lambda messages: len(messages) >= 10)
+            assert subscriber.temperatures() == list(range(5, 15))
+        finally:
+            await frontend.close()
+            if subscriber:
+                subscriber.close()
+            await broker.shutdown()
+
+    asyncio.run(run())
+
+
+def test_requeue_on_disconnect(monkeypatch):
+    async def run():
+        port = _free_port()
+        broker = _create_broker(port)
+        await broker.start()
+        subscriber = _Subscriber(port, 'metarstation/readings')
+
+        # the connection drops in the middle of the burst, with messages in flight or waiting for their turn
+        client_publish = aiomqtt.Client.publish
+        published = 0
+
+        async def publish(self, topic, payload, **kwargs):
+            nonlocal published
+            published += 1
+            if published == 50:
+                self._client.socket().shutdown(socket.SHUT_RDWR)
+            return await client_publish(self, topic, payload, **kwargs)
+
+        monkeypatch.setattr(aiomqtt.Client, 'publish', publish)
+        frontend = _create_frontend(port, max_inflight=20)
+        try:
+            await subscriber.subscribed.wait()
+            await frontend.setup()
+            await frontend.send_data([_reading(i) for i in range(200)])
+
+            # messages might be published twice (QoS 1), but none is lost
+            await subscriber.wait_for(lambda messages: len({m.payload for m in messages}) >= 200)
+            assert set(subscriber.temperatures()) == set(range(200))
+            assert published > 200
+            assert frontend.dropped == 0
+        finally:
+            await frontend.close()
+            subscriber.close()
+            await broker.shutdown()
+
+    asyncio.run(run())
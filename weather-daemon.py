@@ -1,7 +1,7 @@
 #!/usr/bin/env -S uv run --script
 # /// script
 # requires-python = ">=3.10"
-# dependencies = ["bleak", "bthome-ble", "httpx", "dataclasses-json", "pytapo", "python-kasa"]
+# dependencies = ["bleak", "bthome-ble", "httpx", "dataclasses-json", "pytapo", "python-kasa", "aiomqtt"]
 # ///
 
 import sys